@@ -7,8 +7,11 @@ from discord.ext import commands
 from discord.ext import tasks
 
 from lib.bot import TMWBot
+from lib.rate_limiter import TokenBucket
 
-AUTO_RECEIVE_LOCK = asyncio.Lock()
+# Discord allows roughly 10 member role edits per 10 seconds per guild.
+ROLE_EDIT_BURST = 10
+ROLE_EDIT_RATE = 1.0
 
 CREATE_AUTO_RECEIVE_TABLE_SQL = """
         CREATE TABLE IF NOT EXISTS auto_receive_roles (
@@ -46,12 +49,16 @@ DELETE_FORBIDDEN_USER_SQL = "DELETE FROM auto_receive_roles_banned WHERE guild_i
 class AutoReceive(commands.Cog):
     def __init__(self, bot: TMWBot):
         self.bot = bot
+        self.role_edit_buckets: dict[int, TokenBucket] = {}
 
     async def cog_load(self):
         await self.bot.RUN(CREATE_AUTO_RECEIVE_TABLE_SQL)
         await self.bot.RUN(CREATE_FORBIDDEN_USERS_TABLE_SQL)
         self.give_auto_roles.start()
 
+    def cog_unload(self):
+        self.give_auto_roles.cancel()
+
     async def get_auto_receive_roles(self, guild_id):
         data = await self.bot.GET(GET_AUTO_RECEIVE_ROLES_SQL, (guild_id,))
         if data:
@@ -110,33 +117,48 @@ class AutoReceive(commands.Cog):
         await self.bot.RUN(DELETE_AUTO_RECEIVE_ROLE_SQL, (interaction.guild.id, role_to_have.id, role_to_get.id))
         await interaction.response.send_message(f"Removed {role_to_have.mention} as a role that should automatically receive {role_to_get.mention}.", ephemeral=True)
 
+    async def process_auto_roles(self, guild: discord.Guild):
+        auto_receive_settings = await self.get_auto_receive_roles(guild.id)
+        banned_user_data = await self.get_forbidden_users(guild.id)
+        roles_to_add: dict[discord.Member, set[discord.Role]] = {}
+        for role_data in auto_receive_settings:
+            role_to_have = guild.get_role(role_data["role_id_to_have"])
+            role_to_get = guild.get_role(role_data["role_id_to_get"])
+            if not role_to_have or not role_to_get:
+                await self.bot.RUN(DELETE_AUTO_RECEIVE_ROLE_SQL,
+                                   (guild.id, role_data["role_id_to_have"], role_data["role_id_to_get"]))
+                continue
+
+            banned_ids = [data["user_id"] for data in banned_user_data if data["role_id"] == role_to_get.id]
+
+            for member in role_to_have.members:
+                if member.id in banned_ids:
+                    print(f"AUTO-RECEIVE: Did not give {member} the role {role_to_get} due to being banned.")
+                    continue
+
+                if role_to_get not in member.roles:
+                    roles_to_add.setdefault(member, set()).add(role_to_get)
+
+        for member, roles in roles_to_add.items():
+            print(f"AUTO-RECEIVE: Gave {member} the roles {', '.join(str(role) for role in roles)}")
+            bucket = self.role_edit_buckets.setdefault(guild.id, TokenBucket(ROLE_EDIT_BURST, ROLE_EDIT_RATE))
+            await bucket.acquire()
+            await member.add_roles(*roles, reason="Auto-receive", atomic=False)
+
     @tasks.loop(minutes=15)
     async def give_auto_roles(self):
         print("AUTO-RECEIVE: Checking for roles to give...")
-        async with AUTO_RECEIVE_LOCK:
-            for guild in self.bot.guilds:
-                auto_receive_settings = await self.get_auto_receive_roles(guild.id)
-                banned_user_data = await self.get_forbidden_users(guild.id)
-                for role_data in auto_receive_settings:
-                    role_to_have = discord.utils.get(guild.roles, id=role_data["role_id_to_have"])
-                    role_to_get = discord.utils.get(guild.roles, id=role_data["role_id_to_get"])
-                    if not role_to_have or not role_to_get:
-                        self.bot.RUN(DELETE_AUTO_RECEIVE_ROLE_SQL,
-                                     (guild.id, role_data["role_id_to_have"], role_data["role_id_to_get"]))
-
-                    banned_ids = [data["user_id"] for data in banned_user_data if data["role_id"] == role_to_get.id]
-
-                    for member in role_to_have.members:
-                        if member.id in banned_ids:
-                            print(f"AUTO-RECEIVE: Did not give {member} the role {role_to_get} due to being banned.")
-                            continue
-
-                        if role_to_get not in member.roles:
-                            print(f"AUTO-RECEIVE: Gave {member} the role {role_to_get}")
-                            await asyncio.sleep(1)
-                            await member.add_roles(role_to_get)
-
-            print("AUTO-RECEIVE: Done checking for roles to give.")
+        guilds = self.bot.guilds
+        results = await asyncio.gather(*(self.process_auto_roles(guild) for guild in guilds), return_exceptions=True)
+        for guild, result in zip(guilds, results):
+            if isinstance(result, Exception):
+                print(f"AUTO-RECEIVE: Failed to process {guild.name}: {result}")
+
+        print("AUTO-RECEIVE: Done checking for roles to give.")
+
+    @give_auto_roles.before_loop
+    async def before_give_auto_roles(self):
+        await self.bot.wait_until_ready()
 
 
 async def setup(bot):
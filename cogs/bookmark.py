@@ -2,7 +2,8 @@ import asyncio
 from lib.bot import TMWBot
 import discord
 from discord.ext import commands
-from .username_fetcher import get_username_db
+from discord.ext import tasks
+from .username_fetcher import get_usernames_db
 
 CREATE_USER_BOOKMARKS_TABLE = """
 CREATE TABLE IF NOT EXISTS user_bookmarks (
@@ -14,6 +15,10 @@ CREATE TABLE IF NOT EXISTS user_bookmarks (
     dm_message_id INTEGER NOT NULL,
     PRIMARY KEY (user_id, message_id));"""
 
+CREATE_USER_BOOKMARKS_DM_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_user_bookmarks_user_dm
+ON user_bookmarks (user_id, dm_message_id);"""
+
 CREATE_BOOKMARKED_MESSAGES_TABLE = """
 CREATE TABLE IF NOT EXISTS bookmarked_messages (
     guild_id INTEGER NOT NULL,
@@ -24,23 +29,35 @@ CREATE TABLE IF NOT EXISTS bookmarked_messages (
     bookmark_count INTEGER NOT NULL DEFAULT 0,
     PRIMARY KEY (guild_id, message_id));"""
 
-UPDATE_BOOKMARK_COUNT_QUERY = """
+ADD_BOOKMARK_COUNT_QUERY = """
 INSERT INTO bookmarked_messages (guild_id, channel_id, message_id, message_author_id, message_link, bookmark_count)
-VALUES (?, ?, ?, ?, ?, ?)
+VALUES (?, ?, ?, ?, ?, 1)
 ON CONFLICT (guild_id, message_id) DO UPDATE SET
-bookmark_count = ?;"""
+bookmark_count = bookmark_count + 1;"""
+
+ADJUST_BOOKMARK_COUNT_QUERY = """
+UPDATE bookmarked_messages SET bookmark_count = MAX(bookmark_count + ?, 0)
+WHERE guild_id = ? AND message_id = ?;"""
+
+SET_BOOKMARK_COUNT_QUERY = """
+UPDATE bookmarked_messages SET bookmark_count = ?
+WHERE guild_id = ? AND message_id = ?;"""
 
-INSERT_USER_BOOKMARK_QUERY = """
+CLAIM_USER_BOOKMARK_QUERY = """
 INSERT INTO user_bookmarks (guild_id, channel_id, user_id, message_id, message_link, dm_message_id)
-VALUES (?, ?, ?, ?, ?, ?);"""
+VALUES (?, ?, ?, ?, ?, 0)
+ON CONFLICT (user_id, message_id) DO NOTHING;"""
+
+SET_USER_BOOKMARK_DM_QUERY = """
+UPDATE user_bookmarks SET dm_message_id = ?
+WHERE user_id = ? AND message_id = ?;"""
+
+RELEASE_USER_BOOKMARK_QUERY = """
+DELETE FROM user_bookmarks WHERE user_id = ? AND message_id = ?;"""
 
 DELETE_USER_BOOKMARK_QUERY = """
 DELETE FROM user_bookmarks WHERE user_id = ? AND dm_message_id = ?;"""
 
-CHECK_BOOKMARK_EXISTS_QUERY = """
-SELECT 1 FROM user_bookmarks 
-WHERE user_id = ? AND message_id = ?;"""
-
 GET_TOP_BOOKMARKS_QUERY = """
 SELECT channel_id, message_id, message_author_id, message_link, bookmark_count
 FROM bookmarked_messages
@@ -60,16 +77,48 @@ class Bookmarks(commands.Cog):
         self.bot = bot
         self.bookmark_emoji = "🔖"
         self.remove_emoji = "❌"
+        self.pending_count_deltas: dict[tuple[int, int], int] = {}
 
     async def cog_load(self):
         await self.bot.RUN(CREATE_USER_BOOKMARKS_TABLE)
+        await self.bot.RUN(CREATE_USER_BOOKMARKS_DM_INDEX)
         await self.bot.RUN(CREATE_BOOKMARKED_MESSAGES_TABLE)
+        self.flush_bookmark_counts.start()
+
+    def cog_unload(self):
+        self.flush_bookmark_counts.cancel()
+
+    def queue_bookmark_count_change(self, guild_id: int, message_id: int, delta: int):
+        message_key = (guild_id, message_id)
+        self.pending_count_deltas[message_key] = self.pending_count_deltas.get(message_key, 0) + delta
+
+    @tasks.loop(seconds=2)
+    async def flush_bookmark_counts(self):
+        # Bursts of reactions on one message collapse into a single UPDATE per flush.
+        pending_count_deltas, self.pending_count_deltas = self.pending_count_deltas, {}
+        statements = [(ADJUST_BOOKMARK_COUNT_QUERY, (delta, guild_id, message_id))
+                      for (guild_id, message_id), delta in pending_count_deltas.items() if delta]
+        if not statements:
+            return
+        try:
+            await self.bot.RUN_TRANSACTION(statements)
+        except Exception as e:
+            # Merge the deltas back so the next tick retries them alongside anything queued meanwhile.
+            for (guild_id, message_id), delta in pending_count_deltas.items():
+                self.queue_bookmark_count_change(guild_id, message_id, delta)
+            print(f"BOOKMARK: Failed to save {len(statements)} bookmark count changes: {e}")
+
+    @flush_bookmark_counts.after_loop
+    async def after_flush_bookmark_counts(self):
+        if self.pending_count_deltas:
+            await self.flush_bookmark_counts()
 
     async def _get_message(self, channel_id: int, message_id: int) -> discord.Message:
         channel = self.bot.get_channel(channel_id)
         if not channel:
             channel = await self.bot.fetch_channel(channel_id)
-        message = discord.utils.get(self.bot.cached_messages, id=message_id)
+        # The connection state searches its message cache newest-first, where recent reactions land.
+        message = self.bot._connection._get_message(message_id)
         if not message:
             message = await channel.fetch_message(message_id)
         return message
@@ -87,10 +136,12 @@ class Bookmarks(commands.Cog):
                         embed.set_image(url=attachment.url)
                         break
 
-            # Add all attachments as fields and collect videos to send as files
+            # Download all videos at once to send as files
+            video_attachments = [attachment for attachment in message.attachments
+                                 if attachment.content_type and attachment.content_type.startswith('video/')]
+            files_to_send = list(await asyncio.gather(*(attachment.to_file() for attachment in video_attachments)))
+
             for idx, attachment in enumerate(message.attachments, 1):
-                if attachment.content_type and attachment.content_type.startswith('video/'):
-                    files_to_send.append(await attachment.to_file())
                 embed.add_field(
                     name=f"Attachment {idx}",
                     value=f"[{attachment.filename}]({attachment.url})",
@@ -109,28 +160,20 @@ class Bookmarks(commands.Cog):
         await dm_message.add_reaction(self.remove_emoji)
         return dm_message
 
-    async def update_bookmark_count(self, payload: discord.RawReactionActionEvent):
-        async with FETCH_LOCK:
-            await asyncio.sleep(1)
-            message = await self._get_message(payload.channel_id, payload.message_id)
-
-        bookmark_count = 0
+    def get_bookmark_reaction_count(self, message: discord.Message) -> int:
         for reaction in message.reactions:
-            if str(reaction.emoji) == self.bookmark_emoji:
-                bookmark_count = reaction.count
-                break
-
-        await self.bot.RUN(UPDATE_BOOKMARK_COUNT_QUERY,
-                           (message.guild.id, message.channel.id, message.id, message.author.id,
-                            message.jump_url, bookmark_count, bookmark_count))
+            if reaction.emoji == self.bookmark_emoji:
+                return reaction.count
+        return 0
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        if payload.user_id == self.bot.user.id:
+        # Only unicode emoji are relevant, so custom emoji are dropped without further work.
+        if payload.emoji.id is not None or payload.user_id == self.bot.user.id:
             return
 
         if payload.guild_id is None:
-            if str(payload.emoji) == self.remove_emoji:
+            if payload.emoji.name == self.remove_emoji:
                 user = self.bot.get_user(payload.user_id)
                 if not user:
                     user = await self.bot.fetch_user(payload.user_id)
@@ -139,43 +182,56 @@ class Bookmarks(commands.Cog):
 
                 try:
                     await self.bot.RUN(DELETE_USER_BOOKMARK_QUERY, (payload.user_id, payload.message_id))
-                    message = await self._get_message(user.dm_channel.id, payload.message_id)
-                    await message.delete()
+                    await user.dm_channel.get_partial_message(payload.message_id).delete()
                 except discord.NotFound:
                     pass
                 return
 
-        if str(payload.emoji) != self.bookmark_emoji or payload.guild_id is None:
+        if payload.emoji.name != self.bookmark_emoji or payload.guild_id is None:
             return
 
-        exists = await self.bot.GET_ONE(CHECK_BOOKMARK_EXISTS_QUERY,
-                                        (payload.user_id, payload.message_id))
+        message_link = f"https://discord.com/channels/{payload.guild_id}/{payload.channel_id}/{payload.message_id}"
+        claimed = await self.bot.RUN(CLAIM_USER_BOOKMARK_QUERY,
+                                     (payload.guild_id, payload.channel_id, payload.user_id, payload.message_id,
+                                      message_link))
 
-        if exists:
-            await self.update_bookmark_count(payload)
+        if not claimed:
+            # An existing claim means the message row was already created, so a queued delta is enough.
+            self.queue_bookmark_count_change(payload.guild_id, payload.message_id, 1)
             return
 
-        async with FETCH_LOCK:
-            message = await self._get_message(payload.channel_id, payload.message_id)
-            user = self.bot.get_user(payload.user_id)
-            if not user:
-                user = await self.bot.fetch_user(payload.user_id)
+        try:
+            async with FETCH_LOCK:
+                message = await self._get_message(payload.channel_id, payload.message_id)
+        except Exception:
+            await self.bot.RUN(RELEASE_USER_BOOKMARK_QUERY, (payload.user_id, payload.message_id))
+            raise
+
+        # Every bookmark reaction is counted, whether or not the DM below goes through,
+        # so a later reaction removal always has a matching increment to undo.
+        await self.bot.RUN(ADD_BOOKMARK_COUNT_QUERY, (message.guild.id, message.channel.id, message.id,
+                                                      message.author.id, message.jump_url))
 
         try:
-            dm_message = await self.send_bookmark_dm(user, message)
-        except discord.Forbidden:
-            return
+            async with FETCH_LOCK:
+                user = self.bot.get_user(payload.user_id)
+                if not user:
+                    user = await self.bot.fetch_user(payload.user_id)
 
-        await self.bot.RUN(INSERT_USER_BOOKMARK_QUERY,
-                           (payload.guild_id, payload.channel_id, payload.user_id, payload.message_id,
-                            message.jump_url, dm_message.id))
+            dm_message = await self.send_bookmark_dm(user, message)
+        except Exception as error:
+            # Release the claim so the user can bookmark the message again later.
+            await self.bot.RUN(RELEASE_USER_BOOKMARK_QUERY, (payload.user_id, payload.message_id))
+            if isinstance(error, discord.Forbidden):
+                return
+            raise
 
-        await self.update_bookmark_count(payload)
+        await self.bot.RUN(SET_USER_BOOKMARK_DM_QUERY, (dm_message.id, payload.user_id, payload.message_id))
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
-        if payload.guild_id is not None and str(payload.emoji) == self.bookmark_emoji:
-            await self.update_bookmark_count(payload)
+        if payload.guild_id is not None and payload.emoji.id is None and payload.emoji.name == self.bookmark_emoji:
+            self.queue_bookmark_count_change(payload.guild_id, payload.message_id, -1)
 
     @discord.app_commands.command(name="bookmarkboard", description="Shows most bookmarked messages")
     @discord.app_commands.guild_only()
@@ -191,8 +247,9 @@ class Bookmarks(commands.Cog):
             color=discord.Color.blue()
         )
 
+        author_names = await get_usernames_db(self.bot, [row[2] for row in leaderboard_data])
         for index, (channel_id, message_id, author_id, message_link, bookmark_count) in enumerate(leaderboard_data, 1):
-            author_name = await get_username_db(self.bot, author_id)
+            author_name = author_names[author_id]
             leaderboard_embed.add_field(
                 name=f"{index}. By {author_name} ({bookmark_count} bookmarks)",
                 value=f"[Jump to message]({message_link})",
@@ -211,15 +268,24 @@ class Bookmarks(commands.Cog):
         if not leaderboard_data:
             return await interaction.edit_original_response(content="No bookmarked messages found.")
 
-        removed_count = 0
-        for channel_id, message_id, author_id, message_link, _ in leaderboard_data:
-            try:
-                await self._get_message(channel_id, message_id)
-            except (discord.NotFound, discord.Forbidden):
-                await self.bot.RUN(DELETE_BOOKMARKED_MESSAGE_QUERY, (interaction.guild.id, message_id))
-                removed_count += 1
-            except Exception as e:
-                continue
+        semaphore = asyncio.Semaphore(5)
+
+        async def check_message(channel_id: int, message_id: int):
+            async with semaphore:
+                try:
+                    message = await self._get_message(channel_id, message_id)
+                except (discord.NotFound, discord.Forbidden):
+                    return DELETE_BOOKMARKED_MESSAGE_QUERY, (interaction.guild.id, message_id)
+                except Exception:
+                    return None
+            # Counts are only adjusted incrementally on reaction events, so resync them with the message here.
+            return SET_BOOKMARK_COUNT_QUERY, (self.get_bookmark_reaction_count(message), interaction.guild.id, message_id)
+
+        results = await asyncio.gather(*(check_message(channel_id, message_id)
+                                         for channel_id, message_id, *_ in leaderboard_data))
+        statements = [result for result in results if result]
+        removed_count = sum(1 for query, _ in statements if query == DELETE_BOOKMARKED_MESSAGE_QUERY)
+        await self.bot.RUN_TRANSACTION(statements)
 
         await interaction.edit_original_response(
             content=f"Cleanup complete. Removed {removed_count} deleted messages from bookmarks.")
@@ -4,6 +4,9 @@ from discord.ext import commands
 from discord.ext import tasks
 
 import re
+import asyncio
+
+HEX_COLOR_RE = re.compile(r"#(?:[0-9a-fA-F]{3}){1,2}")
 
 CREATE_CUSTOM_ROLE_TABLE_SQL = """
         CREATE TABLE IF NOT EXISTS custom_roles (
@@ -15,11 +18,19 @@ CREATE_CUSTOM_ROLE_TABLE_SQL = """
 
 GET_CUSTOM_ROLES_SQL = "SELECT * FROM custom_roles WHERE guild_id = ?"
 
+GET_CUSTOM_ROLE_SQL = "SELECT * FROM custom_roles WHERE guild_id = ? AND user_id = ?"
+
 SET_CUSTOM_ROLE_SQL = """INSERT INTO custom_roles (guild_id, user_id, role_id, role_name)
-                        VALUES (?, ?, ?, ?)"""
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                        role_id = excluded.role_id,
+                        role_name = excluded.role_name
+                        WHERE role_id != excluded.role_id OR role_name IS NOT excluded.role_name"""
 
 DELETE_CUSTOM_ROLE_SQL = "DELETE FROM custom_roles WHERE guild_id = ? AND user_id = ?"
 
+DELETE_CUSTOM_ROLES_SQL = "DELETE FROM custom_roles WHERE guild_id = ? AND user_id IN ({placeholders})"
+
 CREATE_CUSTOM_ROLE_SETTINGS_TABLE_SQL = """
         CREATE TABLE IF NOT EXISTS custom_role_settings (
         guild_id INTEGER NOT NULL,
@@ -31,14 +42,23 @@ CREATE_CUSTOM_ROLE_SETTINGS_TABLE_SQL = """
 GET_CUSTOM_ROLE_SETTINGS_SQL = "SELECT * FROM custom_role_settings WHERE guild_id = ?"
 
 SET_CUSTOM_ROLE_SETTINGS_SQL = """INSERT INTO custom_role_settings (guild_id, allowed_roles, reference_role_id, reference_role_name)
-                        VALUES (?, ?, ?, ?)"""
-
-DELETE_CUSTOM_ROLE_SETTINGS_SQL = "DELETE FROM custom_role_settings WHERE guild_id = ?"
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (guild_id) DO UPDATE SET
+                        allowed_roles = excluded.allowed_roles,
+                        reference_role_id = excluded.reference_role_id,
+                        reference_role_name = excluded.reference_role_name
+                        WHERE allowed_roles IS NOT excluded.allowed_roles
+                        OR reference_role_id IS NOT excluded.reference_role_id
+                        OR reference_role_name IS NOT excluded.reference_role_name"""
 
 
 class CustomRole(commands.Cog):
     def __init__(self, bot: TMWBot):
         self.bot = bot
+        self.custom_role_cache: dict[int, dict[int, dict]] = {}
+        self.role_name_cache: dict[int, set[str]] = {}
+        self.settings_cache: dict[int, dict | None] = {}
+        self.member_role_ids: dict[tuple[int, int], frozenset[int]] = {}
 
     async def cog_load(self):
         await self.bot.RUN(CREATE_CUSTOM_ROLE_TABLE_SQL)
@@ -46,28 +66,84 @@ class CustomRole(commands.Cog):
         self.strip_roles.start()
 
     async def get_custom_roles(self, guild_id):
-        data = await self.bot.GET(GET_CUSTOM_ROLES_SQL, (guild_id,))
-        if data:
-            return [{"user_id": row[1], "role_id": row[2], "role_name": row[3]} for row in data]
-        return []
+        if guild_id not in self.custom_role_cache:
+            data = await self.bot.GET(GET_CUSTOM_ROLES_SQL, (guild_id,))
+            self.custom_role_cache[guild_id] = {row[1]: {"user_id": row[1], "role_id": row[2], "role_name": row[3]}
+                                                for row in data}
+        return self.custom_role_cache[guild_id]
+
+    async def get_custom_role(self, guild_id, user_id):
+        if guild_id in self.custom_role_cache:
+            return self.custom_role_cache[guild_id].get(user_id)
+        row = await self.bot.GET_ONE(GET_CUSTOM_ROLE_SQL, (guild_id, user_id))
+        if row:
+            return {"user_id": row[1], "role_id": row[2], "role_name": row[3]}
+        return None
 
     async def get_custom_role_settings(self, guild_id):
-        data = await self.bot.GET(GET_CUSTOM_ROLE_SETTINGS_SQL, (guild_id,))
-        if data:
-            return {"allowed_roles": data[0][1], "reference_role_id": data[0][2], "reference_role_name": data[0][3]}
-        return []
-
-    async def check_if_allowed(self, member: discord.Member, allowed_roles: str):
-        allowed_role_ids = [int(role_id) for role_id in allowed_roles.split(",")]
-        if any(role.id in allowed_role_ids for role in member.roles):
-            return True
-        return False
+        if guild_id not in self.settings_cache:
+            data = await self.bot.GET(GET_CUSTOM_ROLE_SETTINGS_SQL, (guild_id,))
+            if not data:
+                self.settings_cache[guild_id] = None
+                return []
+            self.settings_cache[guild_id] = {"allowed_roles": data[0][1], "reference_role_id": data[0][2],
+                                             "reference_role_name": data[0][3],
+                                             "allowed_role_ids": frozenset(int(role_id) for role_id in data[0][1].split(","))}
+        return self.settings_cache[guild_id] or []
+
+    def get_role_names(self, guild: discord.Guild) -> set[str]:
+        if guild.id not in self.role_name_cache:
+            self.role_name_cache[guild.id] = {role.name for role in guild.roles}
+        return self.role_name_cache[guild.id]
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        self.role_name_cache.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.role_name_cache.pop(role.guild.id, None)
+        # Members lose a deleted role without a member update, so drop every cached view that still holds it.
+        for member_key in [key for key, role_ids in self.member_role_ids.items() if role.id in role_ids]:
+            del self.member_role_ids[member_key]
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.name != after.name:
+            self.role_name_cache.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        # Only members that were already checked are tracked, the rest are built on their first check.
+        member_key = (after.guild.id, after.id)
+        if member_key in self.member_role_ids:
+            self.member_role_ids[member_key] = frozenset(role.id for role in after.roles)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.member_role_ids.pop((member.guild.id, member.id), None)
+
+    def get_member_role_ids(self, member: discord.Member) -> frozenset[int]:
+        member_key = (member.guild.id, member.id)
+        if member_key not in self.member_role_ids:
+            self.member_role_ids[member_key] = frozenset(role.id for role in member.roles)
+        return self.member_role_ids[member_key]
+
+    async def check_if_allowed(self, member: discord.Member, allowed_role_ids: frozenset[int]):
+        return not allowed_role_ids.isdisjoint(self.get_member_role_ids(member))
 
     async def clear_custom_role_data(self, guild: discord.Guild, member_id: int, role_id: int):
+        # The row is only dropped once the role is gone, so a failed delete never leaves an untracked role behind.
         custom_role = guild.get_role(role_id)
         if custom_role:
-            await custom_role.delete()
+            try:
+                await custom_role.delete()
+            except discord.NotFound:
+                pass
+            self.role_name_cache.pop(guild.id, None)
+
         await self.bot.RUN(DELETE_CUSTOM_ROLE_SQL, (guild.id, member_id))
+        self.custom_role_cache.pop(guild.id, None)
 
     @discord.app_commands.command(name="make_custom_role", description="Create a custom role for yourself.")
     @discord.app_commands.guild_only()
@@ -77,6 +153,14 @@ class CustomRole(commands.Cog):
         role_icon="Image that should be used.",)
     async def make_custom_role(self, interaction: discord.Interaction, role_name: str, color_code: str, role_icon: discord.Attachment = None):
         await interaction.response.defer()
+        if len(role_name) > 14:
+            await interaction.followup.send("Please use a shorter role name. Restrict yourself to 14 symbols.")
+            return
+
+        if len(color_code) not in (4, 7) or not HEX_COLOR_RE.fullmatch(color_code):
+            await interaction.followup.send("Please enter a valid hex color code. Example: `#A47267` ")
+            return
+
         custom_role_settings = await self.get_custom_role_settings(interaction.guild.id)
         if not custom_role_settings:
             await interaction.followup.send("Custom role settings are missing. Please ask an admin to set them up.")
@@ -87,30 +171,24 @@ class CustomRole(commands.Cog):
             await interaction.followup.send("The reference role for custom roles is missing.")
             return
 
-        allowed = await self.check_if_allowed(interaction.user, custom_role_settings["allowed_roles"])
+        allowed = await self.check_if_allowed(interaction.user, custom_role_settings["allowed_role_ids"])
         if not allowed:
             await interaction.followup.send("You are not allowed to create a custom role.")
             return
 
-        if len(role_name) > 14:
-            await interaction.followup.send("Please use a shorter role name. Restrict yourself to 14 symbols.")
-            return
+        user_data = await self.get_custom_role(interaction.guild.id, interaction.user.id)
+        old_custom_role = interaction.guild.get_role(user_data["role_id"]) if user_data else None
 
-        color_match = re.search(r"^#(?:[0-9a-fA-F]{3}){1,2}$", color_code)
-        if not color_match:
-            await interaction.followup.send("Please enter a valid hex color code. Example: `#A47267` ")
-            return
-
-        custom_role_data = await self.get_custom_roles(interaction.guild.id)
-        for user_data in custom_role_data:
-            if user_data["user_id"] == interaction.user.id:
-                await self.clear_custom_role_data(interaction.guild, interaction.user.id, user_data["role_id"])
-
-        if role_name in [role.name for role in interaction.guild.roles]:
+        if role_name in self.get_role_names(interaction.guild) and not (old_custom_role and old_custom_role.name == role_name):
             await interaction.followup.send("You can't use this role name. Try another one.")
             return
 
-        actual_color_code = int(re.findall(r"^#((?:[0-9a-fA-F]{3}){1,2})$", color_code)[0], base=16)
+        # The existing row is overwritten by the upsert below, so only the old role itself needs deleting.
+        if old_custom_role:
+            await old_custom_role.delete()
+            self.role_name_cache.pop(interaction.guild.id, None)
+
+        actual_color_code = int(color_code[1:], base=16)
         discord_colour = discord.Colour(actual_color_code)
 
         if role_icon:
@@ -126,18 +204,18 @@ class CustomRole(commands.Cog):
         await interaction.guild.edit_role_positions(positions)
         await interaction.user.add_roles(custom_role)
         await self.bot.RUN(SET_CUSTOM_ROLE_SQL, (interaction.guild.id, interaction.user.id, custom_role.id, role_name))
+        self.custom_role_cache.pop(interaction.guild.id, None)
         await interaction.followup.send(f"Created your custom role: {custom_role.mention}")
 
     @discord.app_commands.command(name="delete_custom_role", description="Remove a custom role from yourself.")
     @discord.app_commands.guild_only()
     async def delete_custom_role(self, interaction: discord.Interaction):
         await interaction.response.defer()
-        custom_role_data = await self.get_custom_roles(interaction.guild.id)
-        for user_data in custom_role_data:
-            if user_data["user_id"] == interaction.user.id:
-                await self.clear_custom_role_data(interaction.guild, interaction.user.id, user_data["role_id"])
-                await interaction.followup.send("Deleted your custom role.")
-                return
+        user_data = await self.get_custom_role(interaction.guild.id, interaction.user.id)
+        if user_data:
+            await self.clear_custom_role_data(interaction.guild, interaction.user.id, user_data["role_id"])
+            await interaction.followup.send("Deleted your custom role.")
+            return
 
         await interaction.followup.send("You don't seem to have a custom role.")
 
@@ -155,51 +233,81 @@ class CustomRole(commands.Cog):
                 int(role_id)) for role_id in select_interaction.data["values"]]
             allowed_role_string = ",".join(select_interaction.data["values"])
 
-            custom_role_settings = await self.get_custom_role_settings(select_interaction.guild.id)
-            if custom_role_settings:
-                await self.bot.RUN(DELETE_CUSTOM_ROLE_SETTINGS_SQL, (select_interaction.guild.id,))
             await self.bot.RUN(SET_CUSTOM_ROLE_SETTINGS_SQL, (select_interaction.guild.id, allowed_role_string, reference_role.id, reference_role.name))
+            self.settings_cache.pop(select_interaction.guild.id, None)
             await select_interaction.followup.send(f"Set up custom roles.\nRoles allowed: {', '.join([role.mention for role in allowed_roles])}\nReference role: {reference_role.mention}")
 
         role_select.callback = role_select_callback
         view_object.add_item(role_select)
         await interaction.followup.send("Select the roles that are allowed to create custom roles.", view=view_object)
 
-    @tasks.loop(minutes=200)
-    async def strip_roles(self):
-        for guild in self.bot.guilds:
-            custom_role_settings = await self.get_custom_role_settings(guild.id)
+    async def strip_guild_roles(self, guild: discord.Guild) -> tuple[str, tuple] | None:
+        """Deletes stale custom roles in a guild and returns the statement that removes their rows."""
+        if guild.id in self.custom_role_cache and not self.custom_role_cache[guild.id]:
+            return
+
+        custom_role_settings = await self.get_custom_role_settings(guild.id)
+
+        if not custom_role_settings:
+            return
+
+        custom_role_data = await self.get_custom_roles(guild.id)
+
+        stale_entries = []
+        for user_data in custom_role_data.values():
+            member = guild.get_member(user_data["user_id"])
+            if not member:
+                stale_entries.append((user_data, f"CUSTOM ROLE: Removed custom role from {str(member)}."))
+                continue
+
+            if not await self.check_if_allowed(member, custom_role_settings["allowed_role_ids"]):
+                stale_entries.append((user_data, f"CUSTOM ROLE: Removed custom role from {str(member)}."))
+                continue
+
+            role = guild.get_role(user_data["role_id"])
 
-            if not custom_role_settings:
+            if not role:
+                stale_entries.append((user_data, f"CUSTOM ROLE: Removed custom role from {str(member)}."))
                 continue
 
-            allowed_role_ids = [int(role_id) for role_id in custom_role_settings["allowed_roles"].split(",")]
-            custom_role_data = await self.get_custom_roles(guild.id)
-
-            for user_data in custom_role_data:
-                member = guild.get_member(user_data["user_id"])
-                if not member:
-                    await self.clear_custom_role_data(guild, user_data["user_id"], user_data["role_id"])
-                    print(f"CUSTOM ROLE: Removed custom role from {str(member)}.")
-                    continue
-
-                if not any(role.id in allowed_role_ids for role in member.roles):
-                    await self.clear_custom_role_data(guild, user_data["user_id"], user_data["role_id"])
-                    print(f"CUSTOM ROLE: Removed custom role from {str(member)}.")
-                    continue
-
-                role = guild.get_role(user_data["role_id"])
-
-                if not role:
-                    await self.clear_custom_role_data(guild, user_data["user_id"], user_data["role_id"])
-                    print(f"CUSTOM ROLE: Removed custom role from {str(member)}.")
-                    continue
-
-                if not role.members:
-                    role_name = user_data["role_name"]
-                    await self.clear_custom_role_data(guild, user_data["user_id"], user_data["role_id"])
-                    print(f"CUSTOM ROLE: Deleted role {role_name}.")
-                    continue
+            if not role.members:
+                stale_entries.append((user_data, f"CUSTOM ROLE: Deleted role {user_data['role_name']}."))
+
+        if not stale_entries:
+            return
+
+        semaphore = asyncio.Semaphore(10)
+
+        async def delete_stale_role(user_data: dict, log_message: str):
+            custom_role = guild.get_role(user_data["role_id"])
+            if custom_role:
+                async with semaphore:
+                    await custom_role.delete()
+            print(log_message)
+
+        await asyncio.gather(*(delete_stale_role(user_data, log_message) for user_data, log_message in stale_entries))
+
+        stale_user_ids = [user_data["user_id"] for user_data, _ in stale_entries]
+        placeholders = ", ".join("?" for _ in stale_user_ids)
+        return DELETE_CUSTOM_ROLES_SQL.format(placeholders=placeholders), (guild.id, *stale_user_ids)
+
+    @tasks.loop(minutes=200)
+    async def strip_roles(self):
+        guilds = self.bot.guilds
+        results = await asyncio.gather(*(self.strip_guild_roles(guild) for guild in guilds), return_exceptions=True)
+        statements = []
+        cleaned_guild_ids = []
+        for guild, result in zip(guilds, results):
+            if isinstance(result, Exception):
+                print(f"CUSTOM ROLE: Failed to clean up custom roles in {guild.name}: {result}")
+            elif result:
+                statements.append(result)
+                cleaned_guild_ids.append(guild.id)
+
+        if statements:
+            await self.bot.RUN_TRANSACTION(statements)
+            for guild_id in cleaned_guild_ids:
+                self.custom_role_cache.pop(guild_id, None)
 
 
 async def setup(bot):
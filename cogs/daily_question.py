@@ -1,8 +1,8 @@
 import discord
-import yaml
 import os
 from discord.ext import commands, tasks
 from lib.bot import TMWBot
+from lib.settings import load_settings
 from discord.utils import utcnow
 import aiohttp
 
@@ -44,8 +44,7 @@ Provide only the question text in Japanese, nothing else."""
 
 
 DAILY_QUESTIONS_SETTINGS_PATH = os.getenv("DAILY_QUESTIONS_SETTINGS_PATH") or "config/daily_questions_settings.yml"
-with open(DAILY_QUESTIONS_SETTINGS_PATH, "r", encoding="utf-8") as f:
-    daily_questions_settings = yaml.safe_load(f)
+daily_questions_settings = load_settings(DAILY_QUESTIONS_SETTINGS_PATH)
 
 
 class DailyQuestion(commands.Cog):
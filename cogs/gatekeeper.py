@@ -1,21 +1,48 @@
 from lib.bot import TMWBot
+from lib.settings import load_settings
+from lib.rate_limiter import TokenBucket
 import discord
 import re
+import io
 import aiohttp
 import asyncio
-import yaml
 import os
+from collections import OrderedDict
 from typing import Optional
 from datetime import datetime, timedelta
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.utils import utcnow
 
 
 KOTOBA_BOT_ID = 251239170058616833
+QUIZ_ID_RE = re.compile(r"game_reports/([\da-z]+)")
 
 GATEKEEPER_SETTINGS_PATH = os.getenv("ALT_GATEKEEPER_SETTINGS_PATH") or "config/gatekeeper_settings.yml"
-with open(GATEKEEPER_SETTINGS_PATH, "r", encoding="utf-8") as f:
-    gatekeeper_settings = yaml.safe_load(f)
+gatekeeper_settings = load_settings(GATEKEEPER_SETTINGS_PATH)
+
+# The rank structure is fixed for the lifetime of the cog, so every per-message lookup goes through these tables.
+ranks_by_name = {guild_id: {rank['name']: rank for rank in rank_structure}
+                 for guild_id, rank_structure in gatekeeper_settings['rank_structure'].items()}
+ranks_by_command = {guild_id: {rank['command']: rank for rank in rank_structure if rank['command']}
+                    for guild_id, rank_structure in gatekeeper_settings['rank_structure'].items()}
+combination_ranks_by_guild = {guild_id: [rank for rank in reversed(rank_structure) if rank['combination_rank'] is True]
+                              for guild_id, rank_structure in gatekeeper_settings['rank_structure'].items()}
+# Built from the reversed structure so that, as with the old linear scan, the first matching rank wins.
+ranks_by_deckset = {guild_id: {(rank.get('deck_range') is not None, frozenset(rank['decks'])): rank
+                               for rank in reversed(rank_structure) if rank.get('decks')}
+                    for guild_id, rank_structure in gatekeeper_settings['rank_structure'].items()}
+quiz_role_ids_by_guild = {guild_id: frozenset(rank['rank_to_get'] for rank in rank_structure if rank['rank_to_get'])
+                          for guild_id, rank_structure in gatekeeper_settings['rank_structure'].items()}
+levelup_channel_ids_by_guild = {guild_id: frozenset(rank_settings['valid_levelup_channels'])
+                                for guild_id, rank_settings in gatekeeper_settings['rank_settings'].items()}
+restricted_quiz_names_by_guild = {guild_id: {name.lower(): name for name in rank_settings['restricted_quiz_names']}
+                                  for guild_id, rank_settings in gatekeeper_settings['rank_settings'].items()}
+restricted_quiz_patterns = {guild_id: re.compile('|'.join(re.escape(name) for name in names), re.IGNORECASE)
+                            for guild_id, names in restricted_quiz_names_by_guild.items() if names}
+quiz_choices_by_guild = {guild_id: [discord.app_commands.Choice(name=rank['name'], value=rank['name'])
+                                    for rank in rank_structure
+                                    if rank['combination_rank'] is False and rank['no_timeout'] is False][0:25]
+                         for guild_id, rank_structure in gatekeeper_settings['rank_structure'].items()}
 
 CREATE_QUIZ_ATTEMPTS_TABLE = """
     CREATE TABLE IF NOT EXISTS quiz_attempts (
@@ -25,6 +52,10 @@ CREATE_QUIZ_ATTEMPTS_TABLE = """
     quiz_name TEXT NOT NULL,
     created_at TIMESTAMP);"""
 
+CREATE_QUIZ_ATTEMPTS_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_quiz_attempts_lookup
+    ON quiz_attempts (guild_id, user_id, quiz_name, created_at DESC);"""
+
 CREATE_PASSED_QUIZZES_TABLE = """
     CREATE TABLE IF NOT EXISTS passed_quizzes (
     guild_id INTEGER NOT NULL,
@@ -48,10 +79,7 @@ GET_PASSED_QUIZZES = """SELECT quiz_name FROM passed_quizzes WHERE guild_id = ?
 
 
 async def quiz_autocomplete(interaction: discord.Interaction, current_input: str):
-    rank_names = [quiz['name'] for quiz in gatekeeper_settings['rank_structure']
-                  [interaction.guild.id] if quiz["combination_rank"] is False and quiz["no_timeout"] is False]
-    possible_choices = [discord.app_commands.Choice(name=rank_name, value=rank_name) for rank_name in rank_names]
-    return possible_choices[0:25]
+    return quiz_choices_by_guild.get(interaction.guild.id, [])
 
 
 async def verify_quiz_settings(quiz_data, quiz_result, member: discord.Member):
@@ -145,23 +173,40 @@ async def get_quiz_id(message: discord.Message):
     """Extract the ID of a quiz to use with the API."""
     try:
         if "Ended" in message.embeds[0].title:
-            return re.findall(r"game_reports/([\da-z]*)", message.embeds[0].fields[-1].value)[0]
+            quiz_id_match = QUIZ_ID_RE.search(message.embeds[0].fields[-1].value)
+            return quiz_id_match.group(1) if quiz_id_match else False
     except IndexError:
         return False
     except TypeError:
         return False
 
 
-kotoba_request_lock = asyncio.Lock()
+KOTOBA_MAX_CONCURRENT_REQUESTS = 4
+KOTOBA_REQUEST_BURST = 2
+KOTOBA_REQUEST_RATE = 0.5
+KOTOBA_MAX_RETRIES = 3
+QUIZ_RESULT_CACHE_SIZE = 512
+LAST_ATTEMPT_CACHE_SIZE = 4096
+TIMEOUT_COALESCE_DELAY = 0.5
+
+kotoba_request_semaphore = asyncio.Semaphore(KOTOBA_MAX_CONCURRENT_REQUESTS)
+kotoba_request_bucket = TokenBucket(KOTOBA_REQUEST_BURST, KOTOBA_REQUEST_RATE)
 
 
-async def extract_quiz_result_from_id(quiz_id):
-    async with kotoba_request_lock:
-        await asyncio.sleep(2)
-        jsonurl = f"https://kotobaweb.com/api/game_reports/{quiz_id}"
-        async with aiohttp.ClientSession() as session:
+async def extract_quiz_result_from_id(session: aiohttp.ClientSession, quiz_id):
+    jsonurl = f"https://kotobaweb.com/api/game_reports/{quiz_id}"
+    async with kotoba_request_semaphore:
+        for attempt in range(KOTOBA_MAX_RETRIES + 1):
+            await kotoba_request_bucket.acquire()
             async with session.get(jsonurl) as resp:
-                return await resp.json()
+                if resp.status != 429 or attempt == KOTOBA_MAX_RETRIES:
+                    return await resp.json()
+                try:
+                    retry_delay = float(resp.headers["Retry-After"])
+                except (KeyError, ValueError):
+                    retry_delay = 2 ** attempt
+            print(f"GATEKEEPER: Kotoba API rate limited, retrying in {retry_delay} seconds.")
+            await asyncio.sleep(retry_delay)
 
 
 async def timeout_member(member: discord.Member, duration_in_minutes: int, reason: str):
@@ -174,34 +219,128 @@ async def timeout_member(member: discord.Member, duration_in_minutes: int, reaso
 class LevelUp(commands.Cog):
     def __init__(self, bot: TMWBot):
         self.bot = bot
+        self.pending_quiz_attempts: list[tuple[int, int, str, datetime]] = []
+        self.last_attempt_cache: OrderedDict[tuple[int, int, str], Optional[datetime]] = OrderedDict()
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self.quiz_result_cache: OrderedDict[str, dict] = OrderedDict()
+        self.pending_timeouts: dict[tuple[int, int], tuple[discord.Member, int, str]] = {}
+        self.timeout_flush_task: Optional[asyncio.Task] = None
 
     async def cog_load(self):
-        await self.bot.RUN(CREATE_QUIZ_ATTEMPTS_TABLE)
-        await self.bot.RUN(CREATE_PASSED_QUIZZES_TABLE)
+        await self.bot.RUN_SCRIPT(CREATE_QUIZ_ATTEMPTS_TABLE + CREATE_QUIZ_ATTEMPTS_INDEX + CREATE_PASSED_QUIZZES_TABLE)
+        # One session for the cog's lifetime keeps Kotoba connections alive between quiz results.
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=64, limit_per_host=KOTOBA_MAX_CONCURRENT_REQUESTS, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=15))
+        self.flush_quiz_attempts.start()
+
+    async def cog_unload(self):
+        self.flush_quiz_attempts.cancel()
+        if self.timeout_flush_task:
+            self.timeout_flush_task.cancel()
+        if self.http_session:
+            await self.http_session.close()
+
+    @tasks.loop(seconds=2)
+    async def flush_quiz_attempts(self):
+        # Attempts are written in one executemany per flush instead of a transaction per quiz.
+        pending_quiz_attempts, self.pending_quiz_attempts = self.pending_quiz_attempts, []
+        if not pending_quiz_attempts:
+            return
+        try:
+            await self.bot.RUN_MANY(ADD_QUIZ_ATTEMPT, pending_quiz_attempts)
+        except Exception as e:
+            # Put the batch back in front so the next tick retries it in order.
+            self.pending_quiz_attempts = pending_quiz_attempts + self.pending_quiz_attempts
+            print(f"GATEKEEPER: Failed to save {len(pending_quiz_attempts)} quiz attempts: {e}")
+
+    @flush_quiz_attempts.error
+    async def flush_quiz_attempts_error(self, error):
+        print(f"GATEKEEPER: Quiz attempt flush loop crashed, restarting: {error}")
+        self.flush_quiz_attempts.restart()
+
+    @flush_quiz_attempts.after_loop
+    async def after_flush_quiz_attempts(self):
+        if self.pending_quiz_attempts:
+            await self.flush_quiz_attempts()
+
+    async def get_quiz_result(self, quiz_id: str) -> dict:
+        # Game reports never change once a quiz has ended, so a repeat lookup can skip the API entirely.
+        if quiz_id in self.quiz_result_cache:
+            self.quiz_result_cache.move_to_end(quiz_id)
+            return self.quiz_result_cache[quiz_id]
+
+        quiz_result = await extract_quiz_result_from_id(self.http_session, quiz_id)
+        if isinstance(quiz_result, dict) and "participants" in quiz_result:
+            self.quiz_result_cache[quiz_id] = quiz_result
+            if len(self.quiz_result_cache) > QUIZ_RESULT_CACHE_SIZE:
+                self.quiz_result_cache.popitem(last=False)
+        return quiz_result
+
+    def queue_timeout(self, member: discord.Member, duration_in_minutes: int, reason: str):
+        # Spammed invalid commands only need the latest timeout, so repeats within the delay collapse into one call.
+        self.pending_timeouts[(member.guild.id, member.id)] = (member, duration_in_minutes, reason)
+        if not self.timeout_flush_task or self.timeout_flush_task.done():
+            self.timeout_flush_task = asyncio.create_task(self.flush_timeouts())
+
+    async def flush_timeouts(self):
+        while self.pending_timeouts:
+            await asyncio.sleep(TIMEOUT_COALESCE_DELAY)
+            pending_timeouts, self.pending_timeouts = self.pending_timeouts, {}
+            results = await asyncio.gather(*(timeout_member(member, duration_in_minutes, reason)
+                                              for member, duration_in_minutes, reason in pending_timeouts.values()),
+                                            return_exceptions=True)
+            for (member, _, _), result in zip(pending_timeouts.values(), results):
+                if isinstance(result, Exception):
+                    print(f"GATEKEEPER: Failed to time out {member} ({member.id}) in {member.guild.name}: {result}")
+
+    def cache_last_attempt_time(self, attempt_key: tuple[int, int, str], attempt_time: Optional[datetime]):
+        self.last_attempt_cache[attempt_key] = attempt_time
+        self.last_attempt_cache.move_to_end(attempt_key)
+        if len(self.last_attempt_cache) > LAST_ATTEMPT_CACHE_SIZE:
+            self.last_attempt_cache.popitem(last=False)
+
+    async def get_last_attempt_time(self, guild_id: int, user_id: int, quiz_name: str) -> Optional[datetime]:
+        # Attempts are only written by register_quiz_attempt and cleared by the reset command, so both keep this current.
+        attempt_key = (guild_id, user_id, quiz_name)
+        if attempt_key in self.last_attempt_cache:
+            self.last_attempt_cache.move_to_end(attempt_key)
+            return self.last_attempt_cache[attempt_key]
+
+        # An evicted key can still have an attempt waiting for the next flush.
+        for attempt in reversed(self.pending_quiz_attempts):
+            if attempt[:3] == attempt_key:
+                self.cache_last_attempt_time(attempt_key, attempt[3])
+                return attempt[3]
+
+        last_attempt = await self.bot.GET_ONE(GET_LAST_QUIZ_ATTEMPT, attempt_key)
+        last_attempt_time = datetime.fromisoformat(last_attempt[1]) if last_attempt else None
+        self.cache_last_attempt_time(attempt_key, last_attempt_time)
+        return last_attempt_time
 
     async def is_in_levelup_channel(self, message: discord.Message):
-        channel_ids = gatekeeper_settings['rank_settings'][message.guild.id]['valid_levelup_channels']
-        channels = [message.guild.get_channel(channel_id) for channel_id in channel_ids]
-        return message.channel in channels
+        return message.channel.id in levelup_channel_ids_by_guild[message.guild.id]
 
     async def is_restricted_quiz(self, message: discord.Message):
-        restricted_quizzes = gatekeeper_settings['rank_settings'][message.guild.id]['restricted_quiz_names']
-        for quiz_name in restricted_quizzes:
-            if quiz_name.lower() in message.content.lower():
-                return quiz_name, True
+        restricted_quiz_pattern = restricted_quiz_patterns.get(message.guild.id)
+        if not restricted_quiz_pattern:
+            return None, False
+        match = restricted_quiz_pattern.search(message.content)
+        if match:
+            matched_name = match.group(0)
+            return restricted_quiz_names_by_guild[message.guild.id].get(matched_name.lower(), matched_name), True
         return None, False
 
-    async def is_valid_quiz(self, message: discord.Message, rank_structure: dict):
-        for quiz in rank_structure:
-            if message.content == quiz['command']:
-                return True, quiz['name']
+    async def is_valid_quiz(self, message: discord.Message):
+        quiz = ranks_by_command[message.guild.id].get(message.content)
+        if quiz:
+            return True, quiz['name']
         return False, None
 
     async def rank_has_cooldown(self, guild_id: int, rank_name: str):
-        rank_structure = gatekeeper_settings['rank_structure'][guild_id]
-        for rank in rank_structure:
-            if rank['name'] == rank_name:
-                return not rank['no_timeout']
+        rank = ranks_by_name[guild_id].get(rank_name)
+        if rank:
+            return not rank['no_timeout']
 
     async def is_command_input_valid(self, message: discord.Message):
         if message.author.bot:
@@ -209,29 +348,29 @@ class LevelUp(commands.Cog):
 
         restricted_quiz_name, is_restricted = await self.is_restricted_quiz(message)
         is_in_levelup_channel = await self.is_in_levelup_channel(message)
-        is_valid_quiz, performed_quiz_name = await self.is_valid_quiz(message, gatekeeper_settings['rank_structure'][message.guild.id])
+        is_valid_quiz, performed_quiz_name = await self.is_valid_quiz(message)
 
         rank_has_cooldown = await self.rank_has_cooldown(message.guild.id, performed_quiz_name)
 
         is_on_cooldown = await self.is_on_cooldown(message, performed_quiz_name, rank_has_cooldown)
         if is_on_cooldown:
-            await timeout_member(message.author, 2, "Quiz on cooldown.")
+            self.queue_timeout(message.author, 2, "Quiz on cooldown.")
             return False
 
         if is_in_levelup_channel and not is_valid_quiz:
             await message.channel.send(f"{message.author.mention} Please use the exact quiz command in the level-up channel.")
-            await timeout_member(message.author, 2, "Invalid quiz attempt.")
+            self.queue_timeout(message.author, 2, "Invalid quiz attempt.")
             return False
 
         if is_restricted:
             if not is_in_levelup_channel or not is_valid_quiz:
                 await message.channel.send(f"{message.author.mention} {restricted_quiz_name} quiz is restricted.\nYou can only use it in the level-up channel with the exact commands.")
-                await timeout_member(message.author, 2, "Restricted quiz attempt.")
+                self.queue_timeout(message.author, 2, "Restricted quiz attempt.")
                 return False
 
         if is_valid_quiz and not is_in_levelup_channel:
             await message.channel.send(f"{message.author.mention} Please use this quiz command in the level-up channels.")
-            await timeout_member(message.author, 2, "Invalid channel for quiz attempt.")
+            self.queue_timeout(message.author, 2, "Invalid channel for quiz attempt.")
             return False
 
         return True
@@ -239,13 +378,11 @@ class LevelUp(commands.Cog):
     async def is_on_cooldown(self, message: discord.Message, quiz_name, rank_has_cooldown):
         if not rank_has_cooldown:
             return False
-        last_attempt = await self.bot.GET_ONE(GET_LAST_QUIZ_ATTEMPT, (message.guild.id, message.author.id, quiz_name))
-        if not last_attempt:
+        last_attempt_time = await self.get_last_attempt_time(message.guild.id, message.author.id, quiz_name)
+        if not last_attempt_time:
             return False
-        quiz_name, last_attempt_time = last_attempt
-        last_attempt_time = datetime.fromisoformat(last_attempt_time)
-        if last_attempt_time + timedelta(days=6) > utcnow():
-            next_attempt_time = last_attempt_time + timedelta(days=6)
+        next_attempt_time = last_attempt_time + timedelta(days=6)
+        if next_attempt_time > utcnow():
             unix_timestamp = int(next_attempt_time.timestamp())
 
             await message.channel.send(
@@ -253,21 +390,17 @@ class LevelUp(commands.Cog):
             return True
 
     async def register_quiz_attempt(self, member: discord.Member, channel: discord.TextChannel, quiz_name):
-        await self.bot.RUN(ADD_QUIZ_ATTEMPT, (member.guild.id, member.id, quiz_name, utcnow()))
+        attempt_time = utcnow()
+        self.pending_quiz_attempts.append((member.guild.id, member.id, quiz_name, attempt_time))
+        self.cache_last_attempt_time((member.guild.id, member.id, quiz_name), attempt_time)
         await channel.send(f"{member.mention} registered attempt for {quiz_name}. You can try again in 6 days.")
 
     async def get_corresponding_quiz_data(self, message: discord.Message, quiz_result: dict):
-        rank_structure = gatekeeper_settings['rank_structure'][message.guild.id]
         if not quiz_result["decks"][0].get("shortName"):
             return None
-        deck_names = [deck['shortName'] for deck in quiz_result["decks"]]
+        deck_names = frozenset(deck['shortName'] for deck in quiz_result["decks"])
         index_specified = bool(quiz_result["decks"][0].get("startIndex"))
-        for rank in rank_structure:
-            index_required = rank.get("deck_range", None) is not None
-            rank_decks = set(rank["decks"]) if rank.get("decks") is not None else set()
-            if rank_decks == set(deck_names) and index_required == index_specified:
-                return rank
-        return None
+        return ranks_by_deckset[message.guild.id].get((index_specified, deck_names))
 
     async def get_all_quiz_roles(self, guild: discord.Guild):
         rank_structure = gatekeeper_settings['rank_structure'][guild.id]
@@ -276,21 +409,20 @@ class LevelUp(commands.Cog):
     async def reward_user(self, member: discord.Member, quiz_data: dict):
         await self.bot.RUN(ADD_PASSED_QUIZ, (member.guild.id, member.id, quiz_data['name']))
         if quiz_data['rank_to_get']:
-            roles = await self.get_all_quiz_roles(member.guild)
             role_to_get = member.guild.get_role(quiz_data['rank_to_get'])
-            await member.remove_roles(*roles)
+            quiz_role_ids = quiz_role_ids_by_guild[member.guild.id]
+            current_quiz_roles = [role for role in member.roles if role.id in quiz_role_ids and role.id != role_to_get.id]
+            if current_quiz_roles:
+                await member.remove_roles(*current_quiz_roles, reason="Rank promotion")
             await member.add_roles(role_to_get)
             return role_to_get
         else:
             await self.check_if_combination_rank_earned(member)
 
     async def check_if_combination_rank_earned(self, member: discord.Member):
-        rank_structure = gatekeeper_settings['rank_structure'][member.guild.id]
-        combination_ranks = [rank_data for rank_data in rank_structure if rank_data['combination_rank'] is True]
         earned_ranks = await self.bot.GET(GET_PASSED_QUIZZES, (member.guild.id, member.id))
         earned_ranks = [rank[0] for rank in earned_ranks]
-        combination_ranks.reverse()
-        for rank in combination_ranks:
+        for rank in combination_ranks_by_guild[member.guild.id]:
 
             if await self.already_owns_higher_or_same_role(rank['rank_to_get'], member):
                 return
@@ -304,17 +436,19 @@ class LevelUp(commands.Cog):
             gatekeeper_settings['rank_settings'][member.guild.id]['announce_channel'])
         await announcement_channel.send(message)
 
+    async def send_dm(self, member: discord.Member, message: str):
+        try:
+            await member.send(message)
+        except discord.Forbidden:
+            pass
+
     async def already_owns_higher_or_same_role(self, rank_to_get_id: int, member: discord.Member):
         role_to_get = member.guild.get_role(rank_to_get_id)
         if not role_to_get:
             return False
 
-        all_rank_roles = sorted(await self.get_all_quiz_roles(member.guild), key=lambda r: r.position, reverse=True)
-
-        for role in member.roles:
-            if role in all_rank_roles and role.position >= role_to_get.position:
-                return True
-        return False
+        quiz_role_ids = quiz_role_ids_by_guild[member.guild.id]
+        return any(role.id in quiz_role_ids and role.position >= role_to_get.position for role in member.roles)
 
     async def already_passed_the_quiz(self, member: discord.Member, quiz_name: str):
         passed_quizzes = await self.bot.GET(GET_PASSED_QUIZZES, (member.guild.id, member.id))
@@ -323,12 +457,10 @@ class LevelUp(commands.Cog):
 
     async def get_next_attempt_time(self, guild_id: int, user_id: int, quiz_name: str) -> Optional[int]:
         """Returns the Unix timestamp of when the user can next attempt the quiz."""
-        last_attempt = await self.bot.GET_ONE(GET_LAST_QUIZ_ATTEMPT, (guild_id, user_id, quiz_name))
-        if not last_attempt:
+        last_attempt_time = await self.get_last_attempt_time(guild_id, user_id, quiz_name)
+        if not last_attempt_time:
             return None
 
-        quiz_name, last_attempt_time = last_attempt
-        last_attempt_time = datetime.fromisoformat(last_attempt_time)
         next_attempt_time = last_attempt_time + timedelta(days=6)
         return int(next_attempt_time.timestamp())
 
@@ -348,7 +480,7 @@ class LevelUp(commands.Cog):
         if not quiz_id:
             return
 
-        quiz_result = await extract_quiz_result_from_id(quiz_id)
+        quiz_result = await self.get_quiz_result(quiz_id)
         quiz_data = await self.get_corresponding_quiz_data(message, quiz_result)
         if not quiz_data:
             return
@@ -371,23 +503,19 @@ class LevelUp(commands.Cog):
 
         if success:
             await self.reward_user(member, quiz_data)
-            await self.send_in_announcement_channel(member, quiz_message)
-            try:
-                await member.send(f"Congratulations! You passed the {quiz_data['name']} quiz!")
-            except discord.Forbidden:
-                pass
+            await asyncio.gather(
+                self.send_in_announcement_channel(member, quiz_message),
+                self.send_dm(member, f"Congratulations! You passed the {quiz_data['name']} quiz!"))
         else:
             if await self.rank_has_cooldown(message.guild.id, quiz_data['name']):
                 await self.register_quiz_attempt(member, message.channel, quiz_data['name'])
 
             next_attempt = await self.get_next_attempt_time(message.guild.id, member.id, quiz_data['name'])
             if next_attempt:
-                try:
-                    await member.send(
-                        f"Your attempt at the {quiz_data['name']} quiz was unsuccessful: {quiz_message}\n"
-                        f"You can try again <t:{next_attempt}:R> (on <t:{next_attempt}:F>).")
-                except discord.Forbidden:
-                    pass
+                await self.send_dm(
+                    member,
+                    f"Your attempt at the {quiz_data['name']} quiz was unsuccessful: {quiz_message}\n"
+                    f"You can try again <t:{next_attempt}:R> (on <t:{next_attempt}:F>).")
 
     @discord.app_commands.command(name="reset_user_cooldown",  description="Reset a users quiz cooldown.")
     @discord.app_commands.guild_only()
@@ -396,23 +524,40 @@ class LevelUp(commands.Cog):
     @discord.app_commands.default_permissions(administrator=True)
     async def clear_user_cooldown(self, interaction: discord.Interaction, user: discord.Member, quiz_to_reset: Optional[str]):
         if not quiz_to_reset:
+            self.pending_quiz_attempts = [attempt for attempt in self.pending_quiz_attempts
+                                          if attempt[:2] != (interaction.guild.id, user.id)]
             await self.bot.RUN(RESET_ALL_QUIZ_ATTEMPTS, (interaction.guild.id, user.id))
+            for attempt_key in [key for key in self.last_attempt_cache if key[:2] == (interaction.guild.id, user.id)]:
+                del self.last_attempt_cache[attempt_key]
             await interaction.response.send_message(f"Cleared all quiz cooldown for {user.mention}.")
         else:
-            if not any(quiz_to_reset in rank['name'] for rank in gatekeeper_settings['rank_structure'][interaction.guild.id]):
+            if quiz_to_reset not in ranks_by_name[interaction.guild.id]:
                 await interaction.response.send_message("Invalid quiz name.", ephemeral=True)
                 return
+            self.pending_quiz_attempts = [attempt for attempt in self.pending_quiz_attempts
+                                          if attempt[:3] != (interaction.guild.id, user.id, quiz_to_reset)]
             await self.bot.RUN(RESET_SPECIFIC_QUIZ_ATTEMPTS, (interaction.guild.id, user.id, quiz_to_reset))
+            self.last_attempt_cache.pop((interaction.guild.id, user.id, quiz_to_reset), None)
             await interaction.response.send_message(f"Cleared quiz cooldown for {user.mention} for `{quiz_to_reset}`.")
 
     @discord.app_commands.command(name="ranktable",  description="Display the distribution of quiz roles in the server.")
     @discord.app_commands.guild_only()
     async def ranktable(self, interaction: discord.Interaction):
         quiz_roles = await self.get_all_quiz_roles(interaction.guild)
-        total_ranked_members = len(set([member for role in quiz_roles for member in role.members]))
+        quiz_role_ids = quiz_role_ids_by_guild[interaction.guild.id]
+
+        # role.members rescans the whole guild on every access, so count all quiz roles in a single pass instead.
+        role_member_counts = dict.fromkeys(quiz_role_ids, 0)
+        total_ranked_members = 0
+        for member in interaction.guild.members:
+            owned_quiz_role_ids = {role.id for role in member.roles if role.id in quiz_role_ids}
+            if owned_quiz_role_ids:
+                total_ranked_members += 1
+                for role_id in owned_quiz_role_ids:
+                    role_member_counts[role_id] += 1
 
         description = "\n".join([
-            f"{role.mention}: {len(role.members)} ({len(role.members) / total_ranked_members * 100:.2f}%)"
+            f"{role.mention}: {role_member_counts[role.id]} ({role_member_counts[role.id] / max(total_ranked_members, 1) * 100:.2f}%)"
             for role in quiz_roles
         ])
 
@@ -436,10 +581,9 @@ class LevelUp(commands.Cog):
         else:
             member_string = [str(member) for member in role.members]
             member_string.append(f"\nTotal {member_count} members.")
-            with open("data/rank_user_count.txt", "w", encoding="utf-8") as text_file:
-                text_file.write("\n".join(member_string))
-            await interaction.response.send_message("List of role members too large. Providing role member list in a file:", file=discord.File("data/rank_user_count.txt"))
-            os.remove("data/rank_user_count.txt")
+            member_file = io.BytesIO("\n".join(member_string).encode("utf-8"))
+            await interaction.response.send_message("List of role members too large. Providing role member list in a file:",
+                                                    file=discord.File(member_file, filename="rank_user_count.txt"))
 
     async def rank_to_get(self, guild_id: int, rank: dict):
         guild = self.bot.get_guild(guild_id)
@@ -462,11 +606,12 @@ class LevelUp(commands.Cog):
         rank_structure = gatekeeper_settings['rank_structure'][guild_id]
 
         rank_command_embed = discord.Embed(title="Rank Commands", color=discord.Color.blurple())
+        now_timestamp = int(utcnow().timestamp())
 
         for rank in rank_structure:
             if rank['command']:
                 next_attempt_time = await self.get_next_attempt_time(guild_id, interaction.user.id, rank['name'])
-                if next_attempt_time and next_attempt_time < int(utcnow().timestamp()):
+                if next_attempt_time and next_attempt_time < now_timestamp:
                     next_attempt_time = None
 
                 description = rank['command'] + "\n"
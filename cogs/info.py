@@ -1,21 +1,30 @@
 import discord
-import yaml
 import os
 from discord.ext import commands
 from typing import Optional
 
+from lib.settings import load_settings
+
 INFO_COMMANDS_PATH = "config/info_commands.yml"
-with open(INFO_COMMANDS_PATH, "r", encoding="utf-8") as f:
-    info_commands = yaml.safe_load(f)
+info_commands = load_settings(INFO_COMMANDS_PATH)
+
+info_keys_lower = [(key.lower(), key) for key in info_commands]
+info_embed_templates = {key: {"title": f"Info for `{key}`", "description": text} for key, text in info_commands.items()}
+default_info_choices = [discord.app_commands.Choice(name=key, value=key) for key in list(info_commands)[:25]]
 
 
 async def info_autocomplete(interaction: discord.Interaction, current: str):
     if not current:
-        return [discord.app_commands.Choice(name=key, value=key) for key in info_commands.keys()][:25]
-    else:
-        return [discord.app_commands.Choice(name=key, value=key)
-                for key in info_commands.keys()
-                if current.lower() in key.lower()][:25]
+        return default_info_choices
+
+    current = current.lower()
+    choices = []
+    for key_lower, key in info_keys_lower:
+        if current in key_lower:
+            choices.append(discord.app_commands.Choice(name=key, value=key))
+            if len(choices) == 25:
+                break
+    return choices
 
 
 class InfoCommand(commands.Cog):
@@ -26,12 +35,12 @@ class InfoCommand(commands.Cog):
     @discord.app_commands.describe(info_key="The topic.")
     @discord.app_commands.autocomplete(info_key=info_autocomplete)
     async def info(self, interaction: discord.Interaction, info_key: str):
-        if info_key not in info_commands.keys():
+        embed_template = info_embed_templates.get(info_key)
+        if not embed_template:
             await interaction.response.send_message("Info key not found.", ephemeral=True)
             return
 
-        text_info = info_commands.get(info_key)
-        embed = discord.Embed(title=f"Info for `{info_key}`", description=text_info, color=discord.Color.random())
+        embed = discord.Embed.from_dict({**embed_template, "color": discord.Color.random().value})
         await interaction.response.send_message(embed=embed)
 
 
@@ -1,22 +1,25 @@
 import asyncio
 import discord
+import itertools
 import os
-import yaml
+import struct
 import time
-import aiosqlite
+from typing import Iterator
 from discord.ext import commands, tasks
 
 from lib.bot import TMWBot
+from lib.settings import load_settings
 
 RANKSAVER_SETTINGS_PATH = os.getenv("ALT_RANKSAVER_SETTINGS_PATH") or "config/rank_saver_settings.yml"
-with open(RANKSAVER_SETTINGS_PATH, "r", encoding="utf-8") as f:
-    ranksaver_settings = yaml.safe_load(f)
+ranksaver_settings = load_settings(RANKSAVER_SETTINGS_PATH)
+ROLE_IDS_TO_IGNORE = frozenset(ranksaver_settings['role_ids_to_ignore'])
+RANK_SAVE_BATCH_SIZE = 1000
 
 CREATE_USER_RANKS_TABLE = """
 CREATE TABLE IF NOT EXISTS user_ranks (
     guild_id INTEGER NOT NULL,
     discord_user_id INTEGER NOT NULL,
-    role_ids TEXT NOT NULL,
+    role_ids BLOB NOT NULL,
     PRIMARY KEY (guild_id, discord_user_id)
 );"""
 
@@ -29,6 +32,26 @@ INSERT OR REPLACE INTO user_ranks (guild_id, discord_user_id, role_ids)
 VALUES (?, ?, ?);"""
 
 
+def pack_role_ids(role_ids: list[int]) -> bytes:
+    return struct.pack(f">{len(role_ids)}Q", *role_ids)
+
+
+def unpack_role_ids(role_ids_data: bytes | str) -> list[int]:
+    # Rows saved before the switch to packed ids hold comma-joined strings until the next save overwrites them.
+    if isinstance(role_ids_data, str):
+        return [int(role_id) for role_id in role_ids_data.split(',')] if role_ids_data else []
+    return [role_id for (role_id,) in struct.iter_unpack(">Q", role_ids_data)]
+
+
+def iter_rank_rows(guild: discord.Guild) -> Iterator[tuple[int, int, str]]:
+    # Assignability only depends on the role, so check it once per guild instead of once per member role.
+    role_ids_to_save = {role.id for role in guild.roles if role.is_assignable() and role.id not in ROLE_IDS_TO_IGNORE}
+    for member in guild.members:
+        if member.bot:
+            continue
+        yield guild.id, member.id, pack_role_ids([role.id for role in member.roles if role.id in role_ids_to_save])
+
+
 class RankSaver(commands.Cog):
     def __init__(self, bot: TMWBot):
         self.bot = bot
@@ -41,33 +64,26 @@ class RankSaver(commands.Cog):
     async def rank_saver(self):
         await asyncio.sleep(10)
         print("RANK SAVER: Saving ranks...")
-        async with aiosqlite.connect(self.bot.path_to_db) as db:
+        saved_count = 0
+        async with self.bot.open_db() as db:
             for guild in self.bot.guilds:
-                all_members = [member for member in guild.members if not member.bot]
-                all_role_ids_to_ignore = ranksaver_settings['role_ids_to_ignore']
-                for member in all_members:
-                    member_role_ids = [
-                        str(role.id) for role in member.roles if role.is_assignable() and role.id not in all_role_ids_to_ignore
-                    ]
-                    role_ids_str = ','.join(member_role_ids)
-                    await db.execute(SAVE_USER_ROLE_QUERY, (guild.id, member.id, role_ids_str))
+                rank_rows = iter_rank_rows(guild)
+                while rank_rows_batch := list(itertools.islice(rank_rows, RANK_SAVE_BATCH_SIZE)):
+                    await db.executemany(SAVE_USER_ROLE_QUERY, rank_rows_batch)
+                    saved_count += len(rank_rows_batch)
             await db.commit()
-        print("RANK SAVER: Ranks saved.")
+        print(f"RANK SAVER: Ranks saved for {saved_count} members.")
 
     @commands.Cog.listener(name="on_member_join")
     async def rank_restorer(self, member: discord.Member):
         result = await self.bot.GET(GET_USER_ROLES_QUERY, (member.guild.id, member.id))
         if result:
-            role_ids_str = result[0][0]
-            role_ids = role_ids_str.split(',') if role_ids_str else []
-            roles_to_restore = [
-                discord.utils.get(member.guild.roles, id=int(role_id)) for role_id in role_ids if discord.utils.get(member.guild.roles, id=int(role_id))
+            assignable_roles = [
+                role for role_id in unpack_role_ids(result[0][0])
+                if role_id not in ROLE_IDS_TO_IGNORE and (role := member.guild.get_role(role_id)) is not None and role.is_assignable()
             ]
-            all_role_ids_to_ignore = ranksaver_settings['role_ids_to_ignore']
-            roles_to_restore = [role for role in roles_to_restore if role.id not in all_role_ids_to_ignore]
-            if roles_to_restore:
+            if assignable_roles:
                 print(f"RANK SAVER: Restoring roles for {member.name}.")
-                assignable_roles = [role for role in roles_to_restore if role.is_assignable()]
                 await member.add_roles(*assignable_roles)
 
                 to_restore_channel = member.guild.get_channel(ranksaver_settings["announce_channel"][member.guild.id])
@@ -1,6 +1,8 @@
 from lib.bot import TMWBot
-import yaml
+from lib.settings import load_settings
 from typing import Optional
+import asyncio
+import heapq
 import os
 
 import discord
@@ -10,8 +12,9 @@ from discord.ext import tasks
 from datetime import datetime, timedelta, timezone
 
 SELFMUTE_SETTINGS_PATH = os.getenv("ALT_SELFMUTE_SETTINGS_PATH") or "config/selfmute_settings.yml"
-with open(SELFMUTE_SETTINGS_PATH, 'r', encoding="utf-8") as settings_file:
-    selfmute_settings = yaml.safe_load(settings_file)
+selfmute_settings = load_settings(SELFMUTE_SETTINGS_PATH)
+mute_role_ids_by_guild = {guild_id: frozenset(guild_config.get("mute_roles", []))
+                          for guild_id, guild_config in selfmute_settings['selfmute_config'].items()}
 
 CREATE_ACTIVE_MUTES_TABLE = """
 CREATE TABLE IF NOT EXISTS active_mutes (
@@ -22,6 +25,11 @@ CREATE TABLE IF NOT EXISTS active_mutes (
     end_time INTEGER NOT NULL,
     PRIMARY KEY (guild_id, user_id));
 """
+CREATE_ACTIVE_MUTES_END_TIME_INDEX = """CREATE INDEX IF NOT EXISTS idx_active_mutes_end_time ON active_mutes (end_time);"""
+
+MIGRATE_MUTE_END_TIMES_QUERY = """UPDATE active_mutes SET end_time = CAST(strftime('%s', end_time) AS INTEGER)
+                                 WHERE typeof(end_time) = 'text';"""
+
 STORE_MUTE_QUERY = """INSERT INTO active_mutes (guild_id, user_id, mute_role_id, roles_to_restore, end_time)
                     VALUES (?,?,?,?,?)
                     ON CONFLICT (guild_id, user_id) DO UPDATE SET
@@ -29,7 +37,10 @@ STORE_MUTE_QUERY = """INSERT INTO active_mutes (guild_id, user_id, mute_role_id,
                     roles_to_restore = excluded.roles_to_restore,
                     end_time = excluded.end_time;"""
 
-GET_ALL_MUTES_QUERY = """SELECT * FROM active_mutes WHERE guild_id = ? ORDER BY end_time ASC"""
+GET_EXPIRED_MUTES_QUERY = """SELECT guild_id, user_id, mute_role_id, roles_to_restore, end_time FROM active_mutes
+                            WHERE end_time <= ? ORDER BY end_time ASC"""
+
+GET_MUTE_END_TIMES_QUERY = """SELECT end_time, guild_id, user_id FROM active_mutes"""
 
 GET_USER_MUTE_QUERY = """SELECT guild_id, user_id, mute_role_id, roles_to_restore, end_time FROM active_mutes WHERE guild_id = ? AND user_id = ?"""
 
@@ -41,18 +52,28 @@ REMOVE_MUTE_QUERY = """DELETE FROM active_mutes WHERE guild_id = ? AND user_id =
 class Selfmute(commands.Cog):
     def __init__(self, bot: TMWBot):
         self.bot = bot
+        # (end_time, guild_id, user_id) of every stored mute. Only used to decide whether a tick needs to query at all,
+        # so entries left behind by early unmutes or re-mutes are harmless.
+        self.mute_end_times: list[tuple[int, int, int]] = []
 
     async def cog_load(self):
         await self.bot.RUN(CREATE_ACTIVE_MUTES_TABLE)
+        # Mutes used to store end_time as a "%Y-%m-%d %H:%M:%S" UTC string.
+        await self.bot.RUN(MIGRATE_MUTE_END_TIMES_QUERY)
+        await self.bot.RUN(CREATE_ACTIVE_MUTES_END_TIME_INDEX)
+        self.mute_end_times = list(await self.bot.GET(GET_MUTE_END_TIMES_QUERY))
+        heapq.heapify(self.mute_end_times)
         self.clear_mutes.start()
 
     async def perform_mute(self, member: discord.Member, mute_role: discord.Role, unmute_time: datetime):
-        roles_not_to_remove = [member.guild.get_role(role_id) for role_id in selfmute_settings['selfmute_config'].get(member.guild.id, {}).get("roles_not_to_remove", [])]
-        roles_to_save = [role for role in member.roles if not role.is_default() and not role.is_premium_subscriber() and role.is_assignable() and role not in roles_not_to_remove]
+        role_ids_not_to_remove = set(selfmute_settings['selfmute_config'].get(member.guild.id, {}).get("roles_not_to_remove", []))
+        roles_to_save = [role for role in member.roles if not role.is_default() and not role.is_premium_subscriber() and role.is_assignable() and role.id not in role_ids_not_to_remove]
         current_roles_string = ",".join([str(role.id) for role in roles_to_save])
-        unmute_time_string = unmute_time.strftime("%Y-%m-%d %H:%M:%S")
-        await self.bot.RUN(STORE_MUTE_QUERY, (member.guild.id, member.id, mute_role.id, current_roles_string, unmute_time_string))
-        new_roles = [role for role in member.roles if role not in roles_to_save] + [mute_role]
+        end_time = int(unmute_time.timestamp())
+        await self.bot.RUN(STORE_MUTE_QUERY, (member.guild.id, member.id, mute_role.id, current_roles_string, end_time))
+        heapq.heappush(self.mute_end_times, (end_time, member.guild.id, member.id))
+        saved_role_ids = {role.id for role in roles_to_save}
+        new_roles = [role for role in member.roles if role.id not in saved_role_ids] + [mute_role]
         await member.edit(roles=new_roles)
 
     @discord.app_commands.command(name="unmute_user",  description="Removes a mute from a user.")
@@ -71,18 +92,18 @@ class Selfmute(commands.Cog):
             await interaction.followup.send(f"{member.mention} has been unmuted and roles restored when possible.", ephemeral=True)
 
     async def perform_user_unmute(self, member: discord.Member, channel: discord.TextChannel, mute_data):
-        all_self_mute_role_ids = selfmute_settings['selfmute_config'].get(member.guild.id, {}).get("mute_roles", [])
-        all_selftmute_roles = [member.guild.get_role(role_id) for role_id in all_self_mute_role_ids]
-        await member.edit(roles=[role for role in member.roles if role not in all_selftmute_roles])
+        all_self_mute_role_ids = mute_role_ids_by_guild.get(member.guild.id, frozenset())
+        await member.edit(roles=[role for role in member.roles if role.id not in all_self_mute_role_ids])
         if not mute_data:
             return
         guild_id, user_id, mute_role_id, role_ids_to_restore, _ = mute_data
         if role_ids_to_restore:
-            roles_to_restore = [member.guild.get_role(int(role_id)) for role_id in role_ids_to_restore.split(",")]
-            roles_to_restore = [role for role in roles_to_restore if role]
+            roles_to_restore = [
+                role for role_id in role_ids_to_restore.split(",")
+                if (role := member.guild.get_role(int(role_id)))
+                and not role.is_default() and not role.is_premium_subscriber() and role.is_assignable()
+            ]
             roles_to_restore.sort(key=lambda role: role.position, reverse=True)
-            roles_to_restore = [role for role in roles_to_restore if not role.is_default(
-            ) and not role.is_premium_subscriber() and role.is_assignable()]
             await member.add_roles(*roles_to_restore)
             if channel:
                 await channel.send(f"**🕒 Unmuted {member.mention} and restored the following roles. 🕒\n{', '.join([role.mention for role in roles_to_restore])}**",
@@ -101,14 +122,15 @@ class Selfmute(commands.Cog):
             await interaction.followup.send("You can only mute yourself for a maximum of 7 days.", ephemeral=True)
             return
 
-        all_self_mute_role_ids = selfmute_settings['selfmute_config'].get(interaction.guild.id, {}).get("mute_roles", [])
-        all_selftmute_roles = [interaction.guild.get_role(role_id) for role_id in all_self_mute_role_ids]
+        all_self_mute_role_ids = mute_role_ids_by_guild.get(interaction.guild.id, frozenset())
+        all_selftmute_roles = [role for role_id in selfmute_settings['selfmute_config'].get(interaction.guild.id, {}).get("mute_roles", [])
+                               if (role := interaction.guild.get_role(role_id))]
 
         if not all_selftmute_roles:
             await interaction.followup.send("This server has no selfmute roles configured.", ephemeral=True)
             return
 
-        if any(role in interaction.user.roles for role in all_selftmute_roles):
+        if not all_self_mute_role_ids.isdisjoint(role.id for role in interaction.user.roles):
             await interaction.followup.send("You are already muted.", ephemeral=True)
             return
 
@@ -161,7 +183,7 @@ class Selfmute(commands.Cog):
         for mute_data_guild in mute_data:
             guild_id, user_id, mute_role_id, role_ids_to_restore, unmute_time = mute_data_guild
             mute_guild = self.bot.get_guild(guild_id)
-            unmute_time = datetime.strptime(unmute_time, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            unmute_time = datetime.fromtimestamp(unmute_time, tz=timezone.utc)
             if unmute_time > discord.utils.utcnow():
                 await interaction.followup.send(f"You are muted until <t:{int(unmute_time.timestamp())}:F>" +
                                                 f"which is <t:{int(unmute_time.timestamp())}:R> on `{mute_guild.name}`.", ephemeral=True)
@@ -173,21 +195,53 @@ class Selfmute(commands.Cog):
 
     @tasks.loop(minutes=1)
     async def clear_mutes(self):
-        for guild in self.bot.guilds:
-            active_mutes = await self.bot.GET(GET_ALL_MUTES_QUERY, (guild.id,))
-            announce_channel_id = selfmute_settings['selfmute_config'].get(guild.id, {}).get("announce_channel")
-            announce_channel = guild.get_channel(announce_channel_id)
-            for mute_data in active_mutes:
-                guild_id, user_id, mute_role_id, role_ids_to_restore, unmute_time = mute_data
-                unmute_time = datetime.strptime(unmute_time, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
-                if unmute_time > discord.utils.utcnow().replace():
-                    return
-                else:
-                    member = guild.get_member(user_id)
-                    if member:
-                        await self.perform_user_unmute(member, announce_channel, mute_data)
-                    else:
-                        await self.bot.RUN(REMOVE_MUTE_QUERY, (guild_id, user_id))
+        now = int(discord.utils.utcnow().timestamp())
+        if not self.mute_end_times or self.mute_end_times[0][0] > now:
+            return
+
+        try:
+            expired_mutes = await self.bot.GET(GET_EXPIRED_MUTES_QUERY, (now,))
+        except Exception as e:
+            # The due entries are still on the heap, so the next tick simply tries again.
+            print(f"SELFMUTE: Failed to load expired mutes: {e}")
+            return
+
+        # Every expired row is either handled below or pushed back, so nothing due is dropped from the heap.
+        while self.mute_end_times and self.mute_end_times[0][0] <= now:
+            heapq.heappop(self.mute_end_times)
+
+        expired_mutes_by_guild: dict[discord.Guild, list[tuple]] = {}
+        for mute_data in expired_mutes:
+            guild = self.bot.get_guild(mute_data[0])
+            if guild:
+                expired_mutes_by_guild.setdefault(guild, []).append(mute_data)
+            else:
+                heapq.heappush(self.mute_end_times, (mute_data[4], mute_data[0], mute_data[1]))
+
+        guilds = list(expired_mutes_by_guild)
+        results = await asyncio.gather(*(self.clear_guild_mutes(guild, expired_mutes_by_guild[guild]) for guild in guilds),
+                                       return_exceptions=True)
+        for guild, result in zip(guilds, results):
+            if isinstance(result, Exception):
+                print(f"SELFMUTE: Failed to clear mutes in {guild.name}: {result}")
+                # Requeue the guild's mutes so the next tick retries them.
+                for mute_data in expired_mutes_by_guild[guild]:
+                    heapq.heappush(self.mute_end_times, (mute_data[4], guild.id, mute_data[1]))
+
+    @clear_mutes.before_loop
+    async def before_clear_mutes(self):
+        await self.bot.wait_until_ready()
+
+    async def clear_guild_mutes(self, guild: discord.Guild, expired_mutes: list[tuple]):
+        announce_channel_id = selfmute_settings['selfmute_config'].get(guild.id, {}).get("announce_channel")
+        announce_channel = guild.get_channel(announce_channel_id)
+        for mute_data in expired_mutes:
+            guild_id, user_id, mute_role_id, role_ids_to_restore, unmute_time = mute_data
+            member = guild.get_member(user_id)
+            if member:
+                await self.perform_user_unmute(member, announce_channel, mute_data)
+            else:
+                await self.bot.RUN(REMOVE_MUTE_QUERY, (guild_id, user_id))
 
 
 async def setup(bot):
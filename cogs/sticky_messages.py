@@ -2,6 +2,8 @@ from lib.bot import TMWBot
 import discord
 from discord.ext import commands
 import asyncio
+import io
+from typing import Optional
 
 CREATE_STICKY_MESSAGES_TABLE = """
 CREATE TABLE IF NOT EXISTS sticky_messages (
@@ -11,10 +13,9 @@ CREATE TABLE IF NOT EXISTS sticky_messages (
     stickied_message_id INTEGER,
     PRIMARY KEY (guild_id, channel_id));"""
 
-GET_STICKY_MESSAGE = """
-SELECT original_message_id, stickied_message_id 
-FROM sticky_messages 
-WHERE guild_id = ? AND channel_id = ?;"""
+GET_ALL_STICKY_MESSAGES = """
+SELECT guild_id, channel_id, original_message_id, stickied_message_id
+FROM sticky_messages;"""
 
 UPDATE_STICKY_MESSAGE = """
 INSERT INTO sticky_messages (guild_id, channel_id, original_message_id, stickied_message_id)
@@ -28,24 +29,95 @@ DELETE FROM sticky_messages
 WHERE guild_id = ? AND channel_id = ?;"""
 
 FETCH_LOCK = asyncio.Lock()
+STICKY_REBUILD_DELAY = 0.75
 
 
 class StickyMessages(commands.Cog):
     def __init__(self, bot: TMWBot):
         self.bot = bot
+        # (guild_id, channel_id) -> (original_message_id, stickied_message_id) for every stored sticky.
+        self.sticky_cache: dict[tuple[int, int], tuple[int, Optional[int]]] = {}
+        # Originals are reposted on every bounce, so keep them instead of refetching. Edits and deletes evict them.
+        self.original_messages: dict[int, discord.Message] = {}
+        # original_message_id -> (filename, data, spoiler, description) of each attachment, so reposts skip the CDN.
+        self.original_attachments: dict[int, list[tuple[str, bytes, bool, Optional[str]]]] = {}
+        self.pending_rebuilds: dict[int, asyncio.TimerHandle] = {}
+        self.rebuild_locks: dict[int, asyncio.Lock] = {}
+        self.rebuild_tasks: set[asyncio.Task] = set()
 
     async def cog_load(self):
         await self.bot.RUN(CREATE_STICKY_MESSAGES_TABLE)
+        sticky_rows = await self.bot.GET(GET_ALL_STICKY_MESSAGES)
+        self.sticky_cache = {(guild_id, channel_id): (original_message_id, stickied_message_id)
+                             for guild_id, channel_id, original_message_id, stickied_message_id in sticky_rows}
+
+    def cog_unload(self):
+        for pending_rebuild in self.pending_rebuilds.values():
+            pending_rebuild.cancel()
+
+    def get_sticky(self, guild_id: int, channel_id: int) -> Optional[tuple[int, Optional[int]]]:
+        return self.sticky_cache.get((guild_id, channel_id))
+
+    async def set_sticky(self, guild_id: int, channel_id: int, original_message_id: int, stickied_message_id: int):
+        await self.bot.RUN(UPDATE_STICKY_MESSAGE, (guild_id, channel_id, original_message_id, stickied_message_id))
+        previous_sticky = self.sticky_cache.get((guild_id, channel_id))
+        if previous_sticky and previous_sticky[0] != original_message_id:
+            self.forget_original_message(previous_sticky[0])
+        self.sticky_cache[(guild_id, channel_id)] = (original_message_id, stickied_message_id)
+
+    async def delete_sticky(self, guild_id: int, channel_id: int):
+        await self.bot.RUN(DELETE_STICKY_MESSAGE, (guild_id, channel_id))
+        sticky_data = self.sticky_cache.pop((guild_id, channel_id), None)
+        if sticky_data:
+            self.forget_original_message(sticky_data[0])
+
+    async def get_original_message(self, channel_id: int, message_id: int) -> discord.Message:
+        original_message = self.original_messages.get(message_id)
+        if not original_message:
+            original_message = await self._get_message(channel_id, message_id)
+            self.original_messages[message_id] = original_message
+        return original_message
+
+    def forget_original_message(self, message_id: int):
+        self.original_messages.pop(message_id, None)
+        self.original_attachments.pop(message_id, None)
+
+    async def get_sticky_files(self, original_message: discord.Message) -> list[discord.File]:
+        attachments = self.original_attachments.get(original_message.id)
+        if attachments is None:
+            attachment_data = await asyncio.gather(*(attachment.read() for attachment in original_message.attachments))
+            attachments = [(attachment.filename, data, attachment.is_spoiler(), attachment.description)
+                           for attachment, data in zip(original_message.attachments, attachment_data)]
+            self.original_attachments[original_message.id] = attachments
+        return [discord.File(io.BytesIO(data), filename=filename, spoiler=spoiler, description=description)
+                for filename, data, spoiler, description in attachments]
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        self.forget_original_message(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.forget_original_message(payload.message_id)
 
     async def _get_message(self, channel_id: int, message_id: int) -> discord.Message:
         channel = self.bot.get_channel(channel_id)
         if not channel:
             channel = await self.bot.fetch_channel(channel_id)
-        message = discord.utils.get(self.bot.cached_messages, id=message_id)
+        message = self.bot._connection._get_message(message_id)
         if not message:
             message = await channel.fetch_message(message_id)
         return message
 
+    async def delete_old_sticky(self, channel: discord.abc.Messageable, old_sticky_id: Optional[int]):
+        if not old_sticky_id:
+            return
+        try:
+            # Deleting only needs the id, so skip fetching the message first.
+            await channel.get_partial_message(old_sticky_id).delete()
+        except discord.NotFound:
+            pass
+
     @discord.app_commands.command(name="sticky_last_message", description="Make the last message sticky in this channel")
     @discord.app_commands.guild_only()
     @discord.app_commands.default_permissions(manage_messages=True)
@@ -59,17 +131,16 @@ class StickyMessages(commands.Cog):
             last_message = message
             break
 
-        sticky_message = await interaction.channel.send(
-            f"📌 **Sticky Message:**\n\n{last_message.content}",
-            embed=last_message.embeds[0] if last_message.embeds else None,
-            files=[await attachment.to_file() for attachment in last_message.attachments]
-        )
+        # Hold the rebuild lock so a bounce in progress can't overwrite the new sticky with the old one.
+        async with self.rebuild_locks.setdefault(interaction.channel_id, asyncio.Lock()):
+            sticky_message = await interaction.channel.send(
+                f"📌 **Sticky Message:**\n\n{last_message.content}",
+                embed=last_message.embeds[0] if last_message.embeds else None,
+                files=await self.get_sticky_files(last_message)
+            )
 
-        await self.bot.RUN(UPDATE_STICKY_MESSAGE,
-                           (interaction.guild_id,
-                            interaction.channel_id,
-                            last_message.id,
-                            sticky_message.id))
+            await self.set_sticky(interaction.guild_id, interaction.channel_id, last_message.id, sticky_message.id)
+            self.original_messages[last_message.id] = last_message
 
         await interaction.followup.send("Message has been made sticky!", ephemeral=True)
 
@@ -79,24 +150,18 @@ class StickyMessages(commands.Cog):
     async def unsticky(self, interaction: discord.Interaction):
         await interaction.response.defer()
 
-        sticky_data = await self.bot.GET_ONE(GET_STICKY_MESSAGE,
-                                             (interaction.guild_id,
-                                              interaction.channel_id))
+        # Hold the rebuild lock so a bounce in progress can't repost the sticky after it was removed.
+        async with self.rebuild_locks.setdefault(interaction.channel_id, asyncio.Lock()):
+            sticky_data = self.get_sticky(interaction.guild_id, interaction.channel_id)
 
-        if not sticky_data:
-            await interaction.followup.send("No sticky message found in this channel!", ephemeral=True)
-            return
+            if not sticky_data:
+                await interaction.followup.send("No sticky message found in this channel!", ephemeral=True)
+                return
 
-        try:
             _, stickied_message_id = sticky_data
-            message = await self._get_message(interaction.channel_id, stickied_message_id)
-            await message.delete()
-        except discord.NotFound:
-            pass
+            await self.delete_old_sticky(interaction.channel, stickied_message_id)
 
-        await self.bot.RUN(DELETE_STICKY_MESSAGE,
-                           (interaction.guild_id,
-                            interaction.channel_id))
+            await self.delete_sticky(interaction.guild_id, interaction.channel_id)
 
         await interaction.followup.send("Sticky message has been removed!", ephemeral=True)
 
@@ -105,42 +170,49 @@ class StickyMessages(commands.Cog):
         if message.author.bot or not message.guild:
             return
 
-        sticky_data = await self.bot.GET_ONE(GET_STICKY_MESSAGE,
-                                             (message.guild.id,
-                                              message.channel.id))
-
-        if not sticky_data:
+        if not self.get_sticky(message.guild.id, message.channel.id):
             return
 
-        original_message_id, old_sticky_id = sticky_data
-
-        try:
-            if old_sticky_id:
-                old_sticky = await self._get_message(message.channel.id, old_sticky_id)
-                await old_sticky.delete()
-        except discord.NotFound:
-            pass
-
-        try:
-            original_message = await self._get_message(message.channel.id, original_message_id)
-
-            new_sticky = await message.channel.send(
-                f"📌 **Sticky Message:**\n\n{original_message.content}",
-                embed=original_message.embeds[0] if original_message.embeds else None,
-                files=[await attachment.to_file() for attachment in original_message.attachments]
-            )
-
-            await self.bot.RUN(UPDATE_STICKY_MESSAGE,
-                               (message.guild.id,
-                                message.channel.id,
-                                original_message_id,
-                                new_sticky.id))
-
-        except discord.NotFound:
-            await self.bot.RUN(DELETE_STICKY_MESSAGE,
-                               (message.guild.id,
-                                message.channel.id))
-
+        # A burst of messages only needs the sticky reposted once, after the last one.
+        pending_rebuild = self.pending_rebuilds.pop(message.channel.id, None)
+        if pending_rebuild:
+            pending_rebuild.cancel()
+        self.pending_rebuilds[message.channel.id] = asyncio.get_running_loop().call_later(
+            STICKY_REBUILD_DELAY, self.start_rebuild, message.channel)
+
+    def start_rebuild(self, channel: discord.abc.GuildChannel):
+        self.pending_rebuilds.pop(channel.id, None)
+        rebuild_task = asyncio.create_task(self.rebuild_sticky(channel))
+        self.rebuild_tasks.add(rebuild_task)
+        rebuild_task.add_done_callback(self.rebuild_tasks.discard)
+
+    async def rebuild_sticky(self, channel: discord.abc.GuildChannel):
+        async with self.rebuild_locks.setdefault(channel.id, asyncio.Lock()):
+            sticky_data = self.get_sticky(channel.guild.id, channel.id)
+            if not sticky_data:
+                return
+
+            original_message_id, old_sticky_id = sticky_data
+
+            try:
+                # Removing the previous copy and loading the original don't depend on each other.
+                _, original_message = await asyncio.gather(
+                    self.delete_old_sticky(channel, old_sticky_id),
+                    self.get_original_message(channel.id, original_message_id))
+
+                new_sticky = await channel.send(
+                    f"📌 **Sticky Message:**\n\n{original_message.content}",
+                    embed=original_message.embeds[0] if original_message.embeds else None,
+                    files=await self.get_sticky_files(original_message)
+                )
+
+                await self.set_sticky(channel.guild.id, channel.id, original_message_id, new_sticky.id)
+
+            except discord.NotFound:
+                await self.delete_sticky(channel.guild.id, channel.id)
+            except Exception:
+                # Rebuilds run as detached tasks, so report failures here instead of losing them.
+                await self.bot.on_error("sticky_messages.rebuild_sticky")
 
 async def setup(bot):
     await bot.add_cog(StickyMessages(bot))
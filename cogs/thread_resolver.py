@@ -1,30 +1,16 @@
 from lib.bot import TMWBot
+from lib.settings import load_settings
 import discord
 import os
-import yaml
 import asyncio
 from datetime import timedelta
 from discord.ext import commands
 from discord.ext import tasks
 
 THREAD_RESOLVER_SETTINGS_PATH = os.getenv("ALT_THREAD_RESOLVER_SETTINGS") or "config/thread_resolver_settings.yml"
-with open(THREAD_RESOLVER_SETTINGS_PATH, "r", encoding="utf-8") as f:
-    thread_resolver_settings = yaml.safe_load(f)
+thread_resolver_settings = load_settings(THREAD_RESOLVER_SETTINGS_PATH)
 
-
-async def _get_channel(bot: TMWBot, channel_id: int) -> discord.TextChannel:
-    channel = bot.get_channel(channel_id)
-    if not channel:
-        channel = await bot.fetch_channel(channel_id)
-    return channel
-
-
-async def _get_message(bot: TMWBot, channel_id: int, message_id: int) -> discord.Message:
-    channel = await _get_channel(bot, channel_id)
-    message = discord.utils.get(bot.cached_messages, id=message_id)
-    if not message:
-        message = await channel.fetch_message(message_id)
-    return message
+THREAD_REMINDER_CONCURRENCY = 3
 
 
 class Resolver(commands.Cog):
@@ -69,17 +55,28 @@ class Resolver(commands.Cog):
             await asyncio.sleep(3)
         await thread.send(f'{thread.owner.mention} Please use the `/solved` command once your problem has been solved.')
 
+    def get_last_activity(self, thread: discord.Thread):
+        # The creation time is encoded in the snowflake, so the last message never has to be fetched.
+        if thread.last_message_id:
+            return discord.utils.snowflake_time(thread.last_message_id)
+        return thread.created_at or discord.utils.snowflake_time(thread.id)
+
     async def ask_if_solved_for_guild(self, guild: discord.Guild):
         question_forums = await self.get_guild_help_forums(guild.id)
         if not question_forums:
             return
-        for question_forum in question_forums:
-            for thread in question_forum.threads:
-                if "[SOLVED]" in thread.name or thread.archived:
-                    continue
-                last_message = await _get_message(self.bot, thread.id, thread.last_message_id)
-                if discord.utils.utcnow() - last_message.created_at > timedelta(hours=24):
-                    await thread.send(f'{thread.owner.mention} has your problem been solved? If so, do  ``/solved`` to close this thread.')
+        open_threads = [thread for question_forum in question_forums for thread in question_forum.threads
+                        if "[SOLVED]" not in thread.name and not thread.archived]
+        now = discord.utils.utcnow()
+        stale_threads = [thread for thread in open_threads if now - self.get_last_activity(thread) > timedelta(hours=24)]
+
+        reminder_semaphore = asyncio.Semaphore(THREAD_REMINDER_CONCURRENCY)
+
+        async def remind(thread: discord.Thread):
+            async with reminder_semaphore:
+                await thread.send(f'{thread.owner.mention} has your problem been solved? If so, do  ``/solved`` to close this thread.')
+
+        await asyncio.gather(*(remind(thread) for thread in stale_threads))
 
     @tasks.loop(hours=1)
     async def ask_if_solved(self):
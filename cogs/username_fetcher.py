@@ -1,4 +1,5 @@
 import asyncio
+import time
 from lib.bot import TMWBot
 import discord
 from discord.ext import commands
@@ -21,10 +22,40 @@ VALUES (?, ?) ON CONFLICT(discord_user_id) DO UPDATE SET user_name = excluded.us
 FETCH_USER_QUERY = """
 SELECT user_name FROM users WHERE discord_user_id = ?;"""
 
+FETCH_USERS_QUERY = """
+SELECT discord_user_id, user_name FROM users WHERE discord_user_id IN ({placeholders});"""
+
 FETCH_LOCK = asyncio.Lock()
 
+USERNAME_CACHE_TTL = 300
+USERNAME_CACHE_SIZE = 4096
+_username_cache: dict[int, tuple[float, str]] = {}
+
+
+def get_cached_username(user_id: int) -> str | None:
+    cached = _username_cache.get(user_id)
+    if cached and time.monotonic() - cached[0] < USERNAME_CACHE_TTL:
+        return cached[1]
+    return None
+
+
+def cache_username(user_id: int, user_name: str):
+    _username_cache.pop(user_id, None)
+    if len(_username_cache) >= USERNAME_CACHE_SIZE:
+        _username_cache.pop(next(iter(_username_cache)))
+    _username_cache[user_id] = (time.monotonic(), user_name)
+
 
 async def get_username_db(bot: TMWBot, user_id: int) -> str:
+    user_name = get_cached_username(user_id)
+    if user_name:
+        return user_name
+    user_name = await _resolve_username(bot, user_id)
+    cache_username(user_id, user_name)
+    return user_name
+
+
+async def _resolve_username(bot: TMWBot, user_id: int) -> str:
     user = bot.get_user(user_id)
     if user:
         await bot.RUN(INSERT_USER_QUERY, (user.id, user.display_name))
@@ -42,6 +73,39 @@ async def get_username_db(bot: TMWBot, user_id: int) -> str:
             return 'Unknown User'
 
 
+async def get_usernames_db(bot: TMWBot, user_ids: list[int]) -> dict[int, str]:
+    user_names = {}
+    cached_users = []
+    missing_ids = []
+    for user_id in set(user_ids):
+        user_name = get_cached_username(user_id)
+        if user_name:
+            user_names[user_id] = user_name
+            continue
+        user = bot.get_user(user_id)
+        if user:
+            user_names[user.id] = user.display_name
+            cached_users.append(user)
+        else:
+            missing_ids.append(user_id)
+
+    if cached_users:
+        await bot.RUN_TRANSACTION([(INSERT_USER_QUERY, (user.id, user.display_name)) for user in cached_users])
+
+    if missing_ids:
+        placeholders = ", ".join("?" for _ in missing_ids)
+        user_names.update(await bot.GET(FETCH_USERS_QUERY.format(placeholders=placeholders), tuple(missing_ids)))
+
+    for user_id in missing_ids:
+        if user_id not in user_names:
+            user_names[user_id] = await _resolve_username(bot, user_id)
+
+    for user_id in [user.id for user in cached_users] + missing_ids:
+        cache_username(user_id, user_names[user_id])
+
+    return user_names
+
+
 class UsernameFetcher(commands.Cog):
     def __init__(self, bot: TMWBot):
         self.bot = bot
@@ -49,6 +113,10 @@ class UsernameFetcher(commands.Cog):
     async def cog_load(self):
         await self.bot.RUN(CREATE_USERS_TABLE)
 
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        _username_cache.pop(after.id, None)
+
 
 async def setup(bot):
     await bot.add_cog(UsernameFetcher(bot))
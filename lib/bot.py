@@ -4,6 +4,7 @@ import aiosqlite
 import logging
 import sys
 import traceback
+from contextlib import asynccontextmanager
 from discord.ext import commands
 
 _log = logging.getLogger(__name__)
@@ -15,6 +16,7 @@ class TMWBot(commands.Bot):
         super().__init__(command_prefix=command_prefix, intents=discord.Intents.all())
         self.cog_folder = cog_folder
         self.path_to_db = path_to_db
+        self.wal_enabled = False
 
         db_directory = os.path.dirname(self.path_to_db)
         if not os.path.exists(db_directory):
@@ -50,19 +52,45 @@ class TMWBot(commands.Bot):
 
         await self.debug_dm.send("Bot is ready.")
 
-    async def RUN(self, query: str, params: tuple = ()):
+    @asynccontextmanager
+    async def open_db(self):
         async with aiosqlite.connect(self.path_to_db) as db:
-            await db.execute(query, params)
+            # WAL persists in the database file, so it only has to be switched on once per process.
+            if not self.wal_enabled:
+                await db.execute("PRAGMA journal_mode=WAL")
+                self.wal_enabled = True
+            await db.execute("PRAGMA synchronous=NORMAL")
+            yield db
+
+    async def RUN(self, query: str, params: tuple = ()):
+        async with self.open_db() as db:
+            cursor = await db.execute(query, params)
+            await db.commit()
+            return cursor.rowcount
+
+    async def RUN_TRANSACTION(self, statements: list[tuple[str, tuple]]):
+        async with self.open_db() as db:
+            for query, params in statements:
+                await db.execute(query, params)
             await db.commit()
 
+    async def RUN_MANY(self, query: str, params_seq: list[tuple]):
+        async with self.open_db() as db:
+            await db.executemany(query, params_seq)
+            await db.commit()
+
+    async def RUN_SCRIPT(self, script: str):
+        async with self.open_db() as db:
+            await db.executescript(f"BEGIN;\n{script}\nCOMMIT;")
+
     async def GET(self, query: str, params: tuple = ()):
-        async with aiosqlite.connect(self.path_to_db) as db:
+        async with self.open_db() as db:
             async with db.execute(query, params) as cursor:
                 rows = await cursor.fetchall()
                 return rows
 
     async def GET_ONE(self, query: str, params: tuple = ()):
-        async with aiosqlite.connect(self.path_to_db) as db:
+        async with self.open_db() as db:
             async with db.execute(query, params) as cursor:
                 row = await cursor.fetchone()
                 return row
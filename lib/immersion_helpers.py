@@ -1,12 +1,11 @@
 import discord
 import os
-import yaml
 
 from lib.media_types import MEDIA_TYPES
+from lib.settings import load_settings
 
 IMMERSION_LOG_SETTINGS = os.getenv("IMMERSION_LOG_SETTINGS") or "config/immersion_log_settings.yml"
-with open(IMMERSION_LOG_SETTINGS, "r", encoding="utf-8") as f:
-    immersion_log_settings = yaml.safe_load(f)
+immersion_log_settings = load_settings(IMMERSION_LOG_SETTINGS)
 
 
 async def is_valid_channel(interaction: discord.Interaction) -> bool:
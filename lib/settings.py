@@ -0,0 +1,23 @@
+import os
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+_yaml_cache: dict[str, tuple[float, int, dict]] = {}
+
+
+def load_settings(path: str) -> dict:
+    """Load a YAML settings file, reusing the parsed result while the file is unchanged."""
+    stat = os.stat(path)
+    cached = _yaml_cache.get(path)
+    if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(path, "r", encoding="utf-8") as f:
+        settings = yaml.load(f.read(), Loader=SafeLoader)
+
+    _yaml_cache[path] = (stat.st_mtime, stat.st_size, settings)
+    return settings